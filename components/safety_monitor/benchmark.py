@@ -0,0 +1,291 @@
+"""
+Benchmarks the per-frame stages of the safety pipeline.
+
+Feeds synthetic frames of the given resolutions, or the frames of a recorded
+session, through pose estimation, the distance calculation, the fixture check,
+the stream JPEG encoding and the whole pipeline. Reports frames/sec, latency
+percentiles and allocations per stage and stores the results per commit in
+benchmarks/, so runs of different commits can be compared.
+
+Run from the components folder:
+    python -m safety_monitor.benchmark --resolutions 1280x720 640x480
+    python -m safety_monitor.benchmark --session sessions/my_session --compare benchmarks/<commit>.json
+"""
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+from .safety_monitor import SafetyMonitor, SafetyFrameResults
+from .utils.camera_model import CameraModel
+from .utils.jobs import fixture_checker, ImageEncoder
+from .utils.sessions import ReplaySource, ReplayRobotController
+from shared.latency import LatencyRecorder
+from socket_robot_controller.client import RobotState
+
+current_file_path = pathlib.Path(__file__).parent.resolve()
+RESULTS_DIR = os.path.join(current_file_path, "benchmarks")
+
+
+class SyntheticSource:
+    """
+    Frame source with generated color and depth images, a flat scene about 1.5 m from the camera.
+
+    There is no person in the images, so pose estimation finds nothing. The
+    later stages get the fixed landmarks of synthetic_poses() instead, so they
+    run their full path.
+    """
+
+    def __init__(self, width, height, n_frames=30, seed=0):
+        self.width = width
+        self.height = height
+        rng = np.random.default_rng(seed)
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+        self.frames = []
+        for i in range(n_frames):
+            color = np.clip(gradient + rng.normal(0, 10, (height, width, 3)), 0, 255).astype(np.uint8)
+            depth = (1500 + rng.normal(0, 5, (height, width))).astype(np.uint16)
+            self.frames.append(SafetyFrameResults(None, color, None, depth, timestamp=i / 15))
+        self.index = 0
+
+    def start(self) -> CameraModel:
+        intrinsics = SimpleNamespace(
+            width=self.width, height=self.height,
+            fx=0.9 * self.width, fy=0.9 * self.width, ppx=self.width / 2, ppy=self.height / 2,
+        )
+        return CameraModel(intrinsics, 0.001)
+
+    def get_frames(self) -> SafetyFrameResults:
+        frames = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frames
+
+    def stop(self):
+        pass
+
+    @staticmethod
+    def synthetic_poses():
+        """A standing person in the middle of the frame, all 33 landmarks visible and inside the image."""
+        from mediapipe.framework.formats import landmark_pb2
+
+        pose_landmarks = landmark_pb2.NormalizedLandmarkList()
+        for i in range(33):
+            landmark = pose_landmarks.landmark.add()
+            landmark.x = 0.45 + 0.1 * (i % 2)  # Left and right side alternate
+            landmark.y = 0.15 + 0.7 * i / 32  # Head to feet
+            landmark.z = 0.0
+            landmark.visibility = 1.0
+        return SimpleNamespace(pose_landmarks=pose_landmarks)
+
+
+class StaticRobotController:
+    """Robot standing still in its upright pose"""
+
+    tcp_pose = [-0.08, -0.278, -0.151, 1.718, -2.631, -0.023]
+    q = [0.0, -1.571, 1.571, -1.571, -1.571, 0.0]
+
+    def subscribe_robot_state(self):
+        pass
+
+    def get_robot_state(self, max_age=None):
+        return RobotState(time.time(), time.monotonic(), self.tcp_pose, self.q)
+
+    def get_robot_state_at(self, timestamp):
+        return RobotState(timestamp, time.monotonic(), self.tcp_pose, self.q)
+
+    def get_tcp_pose(self):
+        return self.tcp_pose
+
+    def get_actual_q(self):
+        return self.q
+
+
+def load_frames(source, n_frames):
+    frames = []
+    try:
+        for _ in range(n_frames):
+            frames.append(source.get_frames())
+    except EOFError:
+        pass
+    return frames
+
+
+def benchmark_stage(stage, frames, warmup=3, alloc_frames=10):
+    """
+    Runs stage on every frame.
+
+    Returns:
+    dict: fps, p50/p95/p99/max latency in ms, and the mean peak and net
+    allocated KiB per frame measured with tracemalloc in a separate pass.
+    """
+    for i in range(min(warmup, len(frames))):
+        stage(i, frames[i])
+
+    recorder = LatencyRecorder(window=len(frames))
+    start = time.perf_counter()
+    for i, frames_i in enumerate(frames):
+        with recorder.measure("stage"):
+            stage(i, frames_i)
+    elapsed = time.perf_counter() - start
+    result = {"fps": round(len(frames) / elapsed, 2), **recorder.stats()["stage"]}
+
+    # Allocations are measured separately, tracemalloc slows everything down
+    peaks, retained = [], []
+    tracemalloc.start()
+    for i, frames_i in enumerate(frames[:alloc_frames]):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        stage(i, frames_i)
+        after, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        retained.append(after - before)
+    tracemalloc.stop()
+    result["alloc_peak_kib"] = round(float(np.mean(peaks)) / 1024, 1)
+    result["alloc_retained_kib"] = round(float(np.mean(retained)) / 1024, 1)
+    return result
+
+
+def benchmark_monitor(m: SafetyMonitor, frames, synthetic_poses=None):
+    """
+    Benchmarks every stage on frames, the poses of each frame are computed once for the later stages.
+
+    Parameters:
+    synthetic_poses: Used by the stages after pose estimation instead of the detected poses, for frames without a person.
+    """
+    poses = [m.calculate_poses(f.color_image) for f in frames]
+    person_frames = sum(1 for p in poses if p.pose_landmarks)
+    if synthetic_poses is not None:
+        poses = [synthetic_poses] * len(frames)
+
+    def pose_stage(i, f):
+        m.calculate_poses(f.color_image)
+
+    def distance_stage(i, f):
+        m.calculate_human_robot_distance(poses[i], f.depth_image, f.color_image, f.timestamp)
+
+    def fixture_stage(i, f):
+        fixture_checker.check_all_patches(f.color_image, f.depth_image)
+
+    def jpeg_stage(i, f):
+        ImageEncoder.encode(f.color_image)
+
+    def pipeline_stage(i, f):
+        p = m.calculate_poses(f.color_image)
+        if synthetic_poses is not None:
+            p = synthetic_poses
+        m.calculate_human_robot_distance(p, f.depth_image, f.color_image, f.timestamp)
+        fixture_checker.check_all_patches(f.color_image, f.depth_image)
+        image = f.color_image.copy()
+        image = m.apply_landmark_overlay(image, p)
+        image = m.draw_landmark_distances(image)
+        ImageEncoder.encode(image)
+
+    stages = {
+        "pose": pose_stage,
+        "distance": distance_stage,
+        "fixtures": fixture_stage,
+        "jpeg": jpeg_stage,
+        "pipeline": pipeline_stage,
+    }
+    results = {}
+    for name, stage in stages.items():
+        try:
+            results[name] = benchmark_stage(stage, frames)
+        except Exception as e:
+            results[name] = {"error": repr(e)}
+
+    # Without a person pose estimation is faster than in use, note it with the results
+    if "error" not in results["pose"]:
+        results["pose"]["person_frames"] = person_frames
+        if person_frames == 0:
+            results["pose"]["note"] = "no person"
+    if synthetic_poses is not None:
+        for name in ("distance", "pipeline"):
+            if "error" not in results[name]:
+                results[name]["note"] = "synthetic landmarks"
+    return results
+
+
+def current_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True).strip()
+        return f"{commit}-dirty" if dirty else commit
+    except Exception:
+        return "unknown"
+
+
+def print_results(results, baseline=None):
+    for resolution, stages in results.items():
+        print(f"\n{resolution}")
+        print(f"{'stage':<10}{'fps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'peak KiB':>10}{'vs base':>9}")
+        for stage, r in stages.items():
+            if "error" in r:
+                print(f"{stage:<10} failed: {r['error']}")
+                continue
+            change = ""
+            base = (baseline or {}).get(resolution, {}).get(stage, {})
+            if base.get("fps"):
+                change = f"{r['fps'] / base['fps']:.2f}x"
+            print(
+                f"{stage:<10}{r['fps']:>9.1f}{r['p50']:>9.2f}{r['p95']:>9.2f}{r['p99']:>9.2f}"
+                f"{r['alloc_peak_kib']:>10.1f}{change:>9}  {r.get('note', '')}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the safety pipeline stages.")
+    parser.add_argument("--resolutions", nargs="+", default=["1280x720"], help="Synthetic frame resolutions, WIDTHxHEIGHT")
+    parser.add_argument("--session", help="Benchmark the frames of a recorded session instead")
+    parser.add_argument("--frames", type=int, default=50, help="Frames per stage")
+    parser.add_argument("--compare", help="Results file of an earlier run to compare against")
+    parser.add_argument("--no-save", action="store_true")
+    # The stream encoder of the pipeline, set these like STREAM_JPEG_QUALITY and STREAM_SCALE in monitor.py
+    parser.add_argument("--jpeg-quality", type=int, default=ImageEncoder.quality)
+    parser.add_argument("--stream-scale", type=float, default=ImageEncoder.scale)
+    args = parser.parse_args()
+    ImageEncoder.quality = args.jpeg_quality
+    ImageEncoder.scale = args.stream_scale
+
+    if args.session:
+        source = ReplaySource(args.session, realtime=False)
+        sources = {os.path.basename(os.path.normpath(args.session)): (source, ReplayRobotController(args.session, source))}
+    else:
+        sources = {}
+        for resolution in args.resolutions:
+            width, height = map(int, resolution.lower().split("x"))
+            sources[resolution] = (SyntheticSource(width, height), StaticRobotController())
+
+    results = {}
+    for name, (source, robot_controller) in sources.items():
+        m = SafetyMonitor(source=source, robot_controller=robot_controller)
+        m.start()
+        frames = load_frames(source, args.frames)
+        print(f"Benchmarking {name} with {len(frames)} frames")
+        synthetic_poses = source.synthetic_poses() if isinstance(source, SyntheticSource) else None
+        results[name] = benchmark_monitor(m, frames, synthetic_poses)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if not args.no_save:
+        commit = current_commit()
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{commit}.json")
+        with open(path, "w") as f:
+            json.dump({"commit": commit, "created": datetime.now().isoformat(), "frames": args.frames, "results": results}, f, indent=2)
+        print(f"\nSaved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
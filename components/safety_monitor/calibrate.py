@@ -0,0 +1,159 @@
+"""
+Hand-eye calibration of the camera against the robot base.
+
+Computes the robot base -> camera transform from the recorded ArUco marker
+poses (camera frame) and the matching robot TCP poses (base frame), checks
+the residuals and writes the calibration file loaded by the safety monitor.
+
+Run from the components folder:
+    python -m safety_monitor.calibrate
+"""
+import argparse
+import json
+import os
+import pathlib
+import sys
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from .utils.tcp_calculations import (
+    CALIBRATION_FORMAT_VERSION,
+    DEFAULT_CALIBRATION_PATH,
+    rotation_matrix_from_euler_angles,
+)
+
+current_file_path = pathlib.Path(__file__).parent.resolve()
+
+
+def load_poses(file_path):
+    """Loads one [x y z rx ry rz] pose per line, values may be separated by spaces or commas."""
+    poses = []
+    with open(file_path, "r") as f:
+        for line in f:
+            line = line.strip().strip("[]").replace(",", " ")
+            if line:
+                poses.append(list(map(float, line.split())))
+    return np.array(poses)
+
+
+def pose_to_matrix(pose, rotation="rotvec"):
+    """
+    Converts a 6 element pose into a 4x4 transform.
+
+    Parameters:
+    pose: [x, y, z, rx, ry, rz].
+    rotation (str): "rotvec" for rotation vectors (UR TCP poses, ArUco rvecs)
+        or "euler" for xyz Euler angles in radians.
+    """
+    T = np.eye(4)
+    if rotation == "euler":
+        T[:3, :3] = rotation_matrix_from_euler_angles(*pose[3:6])
+    else:
+        T[:3, :3], _ = cv2.Rodrigues(np.asarray(pose[3:6], dtype=np.float64))
+    T[:3, 3] = pose[:3]
+    return T
+
+
+def calibrate(marker_poses, robot_poses, rotation="rotvec"):
+    """
+    Eye-to-hand calibration with the marker mounted on the gripper.
+
+    Parameters:
+    marker_poses (numpy.ndarray): Nx6 marker poses in the camera frame.
+    robot_poses (numpy.ndarray): Nx6 TCP poses in the robot base frame.
+
+    Returns:
+    tuple: (c_T_b, residuals), the 4x4 base -> camera transform and the
+    per sample residual in meters.
+    """
+    if len(marker_poses) != len(robot_poses):
+        raise ValueError("There must be one robot pose for every marker pose.")
+    if len(marker_poses) < 3:
+        raise ValueError("At least three pose pairs are needed for the calibration.")
+
+    c_T_m = [pose_to_matrix(pose, rotation) for pose in marker_poses]
+    b_T_g = [pose_to_matrix(pose, rotation) for pose in robot_poses]
+
+    # For a fixed camera the gripper -> base inputs are replaced by base -> gripper,
+    # which makes calibrateHandEye return camera -> base
+    g_T_b = [np.linalg.inv(T) for T in b_T_g]
+    R_cam2base, t_cam2base = cv2.calibrateHandEye(
+        R_gripper2base=[T[:3, :3] for T in g_T_b],
+        t_gripper2base=[T[:3, 3] for T in g_T_b],
+        R_target2cam=[T[:3, :3] for T in c_T_m],
+        t_target2cam=[T[:3, 3] for T in c_T_m],
+    )
+
+    b_T_c = np.eye(4)
+    b_T_c[:3, :3] = R_cam2base
+    b_T_c[:3, 3] = t_cam2base.flatten()
+    c_T_b = np.linalg.inv(b_T_c)
+
+    return c_T_b, marker_residuals(c_T_b, c_T_m, b_T_g)
+
+
+def marker_residuals(c_T_b, c_T_m, b_T_g):
+    """
+    The marker is rigidly mounted on the gripper, so with a correct calibration
+    every sample gives the same marker position in the gripper frame.
+    Returns the distance of each sample's marker position from their mean.
+    """
+    b_T_c = np.linalg.inv(c_T_b)
+    g_p_m = np.array([
+        (np.linalg.inv(b_T_g_i) @ b_T_c @ c_T_m_i)[:3, 3]
+        for c_T_m_i, b_T_g_i in zip(c_T_m, b_T_g)
+    ])
+    return np.linalg.norm(g_p_m - g_p_m.mean(axis=0), axis=1)
+
+
+def save_calibration(path, c_T_b, residuals, sources):
+    """Writes the versioned calibration file."""
+    calibration = {
+        "version": CALIBRATION_FORMAT_VERSION,
+        "created": datetime.now().isoformat(),
+        "sources": sources,
+        "c_T_b": c_T_b.tolist(),
+        "residuals": {
+            "mean": float(np.mean(residuals)),
+            "max": float(np.max(residuals)),
+            "per_sample": residuals.tolist(),
+        },
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(calibration, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the camera against the robot base.")
+    parser.add_argument("--marker-poses", default=os.path.join(current_file_path, "pose_data/aruco_poses.txt"))
+    parser.add_argument("--robot-poses", default=os.path.join(current_file_path, "pose_data/robot_poses.txt"))
+    parser.add_argument("--rotation", choices=["rotvec", "euler"], default="rotvec",
+                        help="How the rotations in the pose files are stored")
+    parser.add_argument("--max-residual", type=float, default=0.01,
+                        help="Largest accepted residual in meters")
+    parser.add_argument("--output", default=DEFAULT_CALIBRATION_PATH)
+    parser.add_argument("--force", action="store_true", help="Save even if the residuals are too large")
+    args = parser.parse_args()
+
+    marker_poses = load_poses(args.marker_poses)
+    robot_poses = load_poses(args.robot_poses)
+    c_T_b, residuals = calibrate(marker_poses, robot_poses, args.rotation)
+
+    print("Robot base -> camera transform:")
+    print(np.array2string(c_T_b, precision=5, suppress_small=True))
+    print(f"Residuals: mean {np.mean(residuals) * 1000:0.1f} mm, max {np.max(residuals) * 1000:0.1f} mm")
+
+    if np.max(residuals) > args.max_residual and not args.force:
+        print(f"Max residual is above {args.max_residual * 1000:0.1f} mm, calibration not saved.")
+        sys.exit(1)
+
+    sources = {"marker_poses": os.path.basename(args.marker_poses), "robot_poses": os.path.basename(args.robot_poses)}
+    save_calibration(args.output, c_T_b, residuals, sources)
+    print(f"Saved calibration to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
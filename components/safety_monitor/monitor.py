@@ -1,16 +1,15 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response
 import asyncio
+import json
 import threading
 from fastapi.responses import JSONResponse
 import random
 from fastapi.middleware.cors import CORSMiddleware
 import httpx
 from PIL import Image
-import io
-import cv2
-import pathlib
-import os
+import time
+from typing import Dict, List
 
 from .safety_monitor import SafetyMonitor
 from .utils.hrv_calculations import StressDetector
@@ -18,9 +17,15 @@ from .utils.jobs import (
     add_frames_to_queues,
     FixtureStatusQueue,
     DistanceQueue,
-    ImageStreamQueue,
+    DistanceFrameTimes,
+    ImageEncoder,
+    LatestFrames,
+    PoseScheduler,
+    fixture_monitor,
 )
+from .utils import jobs
 from .utils.connection_manager import ConnectionManager
+from .utils.sessions import ReplaySource, ReplayRobotController
 from . import rest_api
 from .models import populate_db
 
@@ -46,6 +51,13 @@ watch_url = "https://jiranek-chochola.cz/die-experts/index.php?limit=15"
 
 CALIBRATING = False
 SHOW_OVERLAY = True
+POSE_WORKERS = 0  # Run pose estimation in this many worker processes, 0 runs it in a thread
+STREAM_JPEG_QUALITY = 80  # Quality of the JPEG images served on /image and /ws/image
+STREAM_SCALE = 0.5  # The stream images are resized by this factor before encoding
+TRACK_POSE_REGION = False  # Run pose estimation only around the last skeleton (single pose thread only)
+REPLAY_SESSION = None  # Path of a recorded session to replay instead of using the camera and robot
+REPLAY_REALTIME = True  # Replay at the recorded rate, otherwise as fast as possible
+FIXTURE_HEARTBEAT = 1.0  # Resend the fixture state after this many seconds without a change, so subscribers notice a dead monitor
 
 # Websocket maanger manager
 distance_manager = ConnectionManager()
@@ -53,8 +65,19 @@ dummy_manager = ConnectionManager()
 fixture_manager = ConnectionManager()
 image_manager = ConnectionManager()
 
+ImageEncoder.quality = STREAM_JPEG_QUALITY
+ImageEncoder.scale = STREAM_SCALE
+
 # Safety monitor
-monitor = SafetyMonitor()
+if REPLAY_SESSION is not None:
+    replay_source = ReplaySource(REPLAY_SESSION, realtime=REPLAY_REALTIME)
+    monitor = SafetyMonitor(
+        track_pose_region=TRACK_POSE_REGION,
+        source=replay_source,
+        robot_controller=ReplayRobotController(REPLAY_SESSION, replay_source),
+    )
+else:
+    monitor = SafetyMonitor(track_pose_region=TRACK_POSE_REGION)
 
 # Hrv stress calculator
 stress_detector = StressDetector()
@@ -63,7 +86,7 @@ task_pool = None
 
 # Conncurent thread pooi
 # Thread for gathering images
-monitor_thread = threading.Thread(target=lambda: add_frames_to_queues(monitor))
+monitor_thread = threading.Thread(target=lambda: add_frames_to_queues(monitor, pose_workers=POSE_WORKERS))
 
 
 @app.on_event("startup")
@@ -72,6 +95,7 @@ def startup():
     monitor.start()
     monitor_thread.start()
     asyncio.create_task(generate_image_stream(image_manager, 60))
+    asyncio.create_task(push_fixture_updates(fixture_manager, FIXTURE_HEARTBEAT))
 
 
 #### Api endpoints
@@ -81,7 +105,8 @@ async def distance_spam_websocket(websocket: WebSocket):
     manager = dummy_manager
     await manager.connect(websocket)
     try:
-        while True:
+        # Nothing is received here, a failed send in the writer is how the disconnect shows up
+        while manager.is_connected(websocket):
             await asyncio.sleep(0.01)
             distance = DistanceQueue.get()
             await manager.broadcast(str(distance))
@@ -99,7 +124,8 @@ async def distance_respond_websocket(websocket: WebSocket):
             await websocket.receive_text()
             all_distances = DistanceQueue.all()
             distance = sum(all_distances)/len(all_distances)
-            await websocket.send_text(str(distance))
+            with monitor.latency.measure("websocket_send"):
+                await websocket.send_text(str(distance))
     except WebSocketDisconnect:
         websocket.disconnect()
 
@@ -116,14 +142,54 @@ async def fixture_status_websocket(websocket: WebSocket):
         websocket.disconnect(websocket)
 
 
+@app.websocket("/ws/fixtures")
+async def fixture_stream_websocket(websocket: WebSocket):
+    """
+    Fixture state subscription. Sends the current state on connect and then every
+    transition as JSON with a sequence number and the frame timestamp.
+    """
+    await fixture_manager.connect(websocket)
+    try:
+        update = fixture_monitor.last_update
+        if update is not None:
+            fixture_manager.send_text(websocket, json.dumps(update))  # Through its writer, never a second sender
+        while True:
+            await websocket.receive_text()  # Nothing to receive, waits for the disconnect
+    except WebSocketDisconnect:
+        fixture_manager.disconnect(websocket)
+
+
+async def push_fixture_updates(manager, heartbeat):
+    """
+    Broadcasts every new fixture state to the /ws/fixtures subscribers as soon as
+    the fixture thread publishes it, and the current state again after heartbeat
+    seconds without a change.
+    """
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+    fixture_monitor.add_listener(lambda update: loop.call_soon_threadsafe(updates.put_nowait, update))
+
+    update = fixture_monitor.last_update
+    while True:
+        try:
+            update = await asyncio.wait_for(updates.get(), timeout=heartbeat)
+        except asyncio.TimeoutError:
+            if update is None:
+                continue  # Nothing detected yet
+        try:
+            await manager.broadcast(json.dumps(update))
+        except Exception as e:
+            print(f"Failed to push fixture state: {e}")
+
+
 @app.websocket("/dummy")
 async def dummy_ws_endpoint(websocket: WebSocket):
     """WebSocket endpoint."""
     manager = dummy_manager
     await manager.connect(websocket)
     try:
-        while True:
-            asyncio.sleep(1)
+        while manager.is_connected(websocket):
+            await asyncio.sleep(1)
             await manager.broadcast("Hello")
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -146,11 +212,16 @@ async def serve_ui_data():
 
     stress_status = stress_detector.add_heart_rate(result)
 
+    # Age of the frame the distance was measured on, for the latency of the whole path
+    frame_time = DistanceFrameTimes.get()
+    distance_age = time.time() - frame_time if frame_time is not None else None
+
     try:
         return JSONResponse(
             {
                 "heartRate": result,
                 "distance": DistanceQueue.get(),
+                "distance_age": distance_age,
                 "stress_status": stress_status,
             }
         )
@@ -164,50 +235,21 @@ async def toggle_calibration():
 
 
 async def generate_image_stream(manager, hz):
-    # Create a NumPy array representing an image (RGB)
-
+    """Sends every newly encoded image to the /ws/image clients, checking hz times per second"""
+    seq = None
     while True:
-        # Convert the NumPy array to an image
-        rgb_image = ImageStreamQueue.get()
-        if rgb_image is None:
-            print("No images in the queue yet.")
-            await manager.broadcast_bytes(await send_loading_image())
-            continue
-        
-        width = int(rgb_image.shape[0]/2)
-        height = int(rgb_image.shape[1]/2)
-        rgb_image = cv2.resize(rgb_image, (height, width))
-        _, buffer = cv2.imencode(".jpg", rgb_image)
-
-        try:
-            # send binary frame data over websocket
-            await manager.broadcast_bytes(buffer.tobytes())
-        except Exception as e:
-            print(e)
-
-        # optional: reduce frame rate for streaming
+        image_seq, image_bytes = ImageEncoder.latest()
+        if image_seq != seq:
+            seq = image_seq
+            await manager.broadcast_bytes(image_bytes)
 
-        # Add a delay to control the frame rate (e.g., 1 frame per second)
         await asyncio.sleep(1 / hz)
 
-async def send_loading_image():
-    current_file_path = pathlib.Path(__file__).parent.resolve()
-    loading_image_path = os.path.join(current_file_path, "./images/loading.jpg")
-
-    with open(loading_image_path, "rb") as image:
-        return image.read()
-
 
 @app.get("/image")
 async def get_image():
-    frame = ImageStreamQueue.get()
-    if frame is None:
-        frame = cv2.imread("./images/loading.jpg", cv2.COLOR_BGR2RGB)
-    
-    success, encoded_image = cv2.imencode(".jpg", frame)
-
-    image_bytes = io.BytesIO(encoded_image.tobytes())
-    return StreamingResponse(image_bytes, media_type="image/jpeg")
+    _, image_bytes = ImageEncoder.latest()
+    return Response(content=image_bytes, media_type="image/jpeg")
 
 
 @app.websocket("/ws/image")
@@ -215,14 +257,46 @@ async def websocket_endpoint(websocket: WebSocket):
     """Handle WebSocket connections and stream frames."""
     await image_manager.connect(websocket)  # Accept the connection
     try:
-        await websocket.send_bytes(await send_loading_image())
-        while True:
-            await asyncio.sleep(10000)
+        image_manager.send_bytes(websocket, ImageEncoder.latest()[1])  # Newest image, or the loading image
+        while image_manager.is_connected(websocket):
+            await asyncio.sleep(1)
     except WebSocketDisconnect:
         image_manager.disconnect(websocket)
 
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Pipeline metrics: effective pose inference rate, pose worker health, captured/dropped frames, the frame ring name, fixture evaluations, encoded stream images and websocket clients"""
+    return {
+        "pose_inference": PoseScheduler.stats(),
+        "pose_workers": jobs.PosePool.stats() if jobs.PosePool is not None else None,
+        "frames": LatestFrames.stats(),
+        "frame_ring": jobs.FrameRing.name if jobs.FrameRing is not None else None,  # Other processes attach to the frames by this name
+        "fixtures": fixture_monitor.stats(),
+        "stream_images_encoded": ImageEncoder.encoded,
+        "connections": {
+            "image": image_manager.stats(),
+            "fixtures": fixture_manager.stats(),
+            "distance": dummy_manager.stats(),
+        },
+    }
+
+
+@app.get("/metrics/latency")
+async def get_latency_metrics():
+    """p50/p95/p99 latency in milliseconds of every stage from the camera to the robot speed slider"""
+    return monitor.latency.stats()
+
+
+@app.post("/metrics/latency")
+async def report_latency(samples: Dict[str, List[float]]):
+    """Latency samples in seconds measured by other processes, e.g. the state machine"""
+    for stage, values in samples.items():
+        monitor.latency.record_many(stage, values)
+    return {"stages": list(samples)}
+
+
 @app.get("/stress_level")
 async def get_safety():
     return {"stress_level": stress_detector.get_safetylevel()}
@@ -0,0 +1,45 @@
+"""
+Records a session of aligned camera frames and robot states for offline replay.
+
+Run from the components folder:
+    python -m safety_monitor.record sessions/my_session --seconds 30
+
+Replay it by setting REPLAY_SESSION in monitor.py, or with
+SafetyMonitor(source=ReplaySource(path), robot_controller=ReplayRobotController(path, source)).
+"""
+import argparse
+import time
+
+from .safety_monitor import SafetyMonitor
+from .utils.sessions import SessionRecorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record camera frames and robot states.")
+    parser.add_argument("path", help="Session directory to write")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--socket-url", default="http://localhost:5000")
+    parser.add_argument("--fps", type=int, default=15)
+    args = parser.parse_args()
+
+    monitor = SafetyMonitor(socket_url=args.socket_url, fps=args.fps)
+    monitor.start()
+    recorder = SessionRecorder(args.path, monitor.camera_model, fps=args.fps)
+
+    end = time.monotonic() + args.seconds
+    try:
+        while time.monotonic() < end:
+            frames = monitor.get_frames()
+            tcp_pose, q = monitor.get_robot_state(frames.timestamp)
+            recorder.write(frames, tcp_pose, q)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+        monitor.stop_monitoring()
+
+    print(f"Recorded {recorder.count} frames to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
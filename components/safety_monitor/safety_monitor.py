@@ -6,9 +6,15 @@ import math
 from dataclasses import dataclass
 from typing import NamedTuple, List
 import time
-from .utils.tcp_calculations import calculate_camera_tcp_coords
+from .utils.tcp_calculations import CameraRobotTransform, DEFAULT_CALIBRATION_PATH
+from .utils.robot_model import CapsuleRobotModel
+from .utils.camera_model import CameraModel, landmarks_to_pixels
+from .utils.pose_tracking import PoseRegionTracker
 from socket_robot_controller.client import RobotSocketClient
 from shared.abfilter import ABFilter
+from shared.latency import LatencyRecorder
+
+ROBOT_STATE_MAX_AGE = 0.2  # Pushed robot states older than this (s) are not used
 
 PATCH_COORDS_LIST = [
     (166, 203, 18, 12),  # Component 1
@@ -25,42 +31,67 @@ class SafetyFrameResults:
     color_image: np.ndarray
     depth_frame: rs.depth_frame
     depth_image: np.ndarray
+    frame_number: int = 0  # Sequence number of the frame in the shared frame ring
+    timestamp: float = 0.0  # Host time (s) the frame was exposed
+
+
+@dataclass
+class SafetyPoseResults:
+    """A captured frame together with the pose landmarks computed once for it"""
+    frames: SafetyFrameResults
+    poses: NamedTuple
 
 
 class SafetyMonitor:
     def __init__(
-        self, safety_distance=0.5, color_res=(1280, 720), depth_res=(1280, 720), fps=15, socket_url="http://localhost:5000"
+        self, safety_distance=0.5, color_res=(1280, 720), depth_res=(1280, 720), fps=15, socket_url="http://localhost:5000",
+        track_pose_region=False, calibration_path=DEFAULT_CALIBRATION_PATH, source=None, robot_controller=None,
     ):
+        """
+        Parameters:
+        source: Frame source used instead of the RealSense pipeline, e.g. a ReplaySource.
+        robot_controller: Used instead of connecting a RobotSocketClient, e.g. a ReplayRobotController.
+        """
         print("Starting the monitor")
         self.safety_distance = safety_distance
-        self.sphere_center_fixtures = [-0.65887, -0.32279, 1.93131]  # in camera frame
-        self.sphere_center_home = [-0.53615, -0.11935, 1.23248]
-        self.sphere_center_place = [-0.15476, 0.1909, 0.91111]
-        self.robot_pose_state = 0  # 0 -> home, 1 -> fixtures, 2 -> place
+        self.color_res = color_res
         self.min_distance_array = []
+        self.landmark_distances = []  # (id, pixel, distance) of each landmark in the last distance calculation
+        self.latency = LatencyRecorder()  # Per stage latencies of the camera -> distance path
         print(socket_url)
-        self.robot_controller = RobotSocketClient(socket_url)
-        self.sphere_radius = 0.2
-        self.pipeline = rs.pipeline()
-        self.config = rs.config()
-
-
-        # Configure the RealSense camera streams
-        self.config.enable_stream(
-            rs.stream.color, color_res[0], color_res[1], rs.format.bgr8, fps
-        )
-        self.config.enable_stream(
-            rs.stream.depth, depth_res[0], depth_res[1], rs.format.z16, fps
-        )
+        if robot_controller is None:
+            robot_controller = RobotSocketClient(socket_url)
+        self.robot_controller = robot_controller
+        self.robot_controller.subscribe_robot_state()  # TCP pose and joint positions are pushed by the server
+        self.robot_model = CapsuleRobotModel()  # Robot links as capsules for the distance calculation
+        self.camera_transform = CameraRobotTransform.load_or_default(calibration_path)  # Robot base -> camera frame
+        self.source = source
+        if source is None:
+            self.pipeline = rs.pipeline()
+            self.config = rs.config()
+
+
+            # Configure the RealSense camera streams
+            self.config.enable_stream(
+                rs.stream.color, color_res[0], color_res[1], rs.format.bgr8, fps
+            )
+            self.config.enable_stream(
+                rs.stream.depth, depth_res[0], depth_res[1], rs.format.z16, fps
+            )
 
         self.align_to = rs.stream.color
         self.align = rs.align(self.align_to)
+        self.camera_model = None  # Cached intrinsics of the aligned stream, set in start()
 
         # Initialize MediaPipe Pose
         self.mp_pose = mp.solutions.pose
         self.pose = self.mp_pose.Pose()
         self.mp_drawing = mp.solutions.drawing_utils
 
+        # Only run pose estimation around the last skeleton instead of on the full frame
+        self.pose_tracker = PoseRegionTracker() if track_pose_region else None
+        self._pose_region = None  # Region the pose graph ran on last, None for the full frame
+
         """
         # Unsure if needed
         # Set up OpenCV window
@@ -72,11 +103,16 @@ class SafetyMonitor:
         print("Done starting the monitor")
 
     def start(self):
+        if self.source is not None:
+            self.camera_model = self.source.start()
+            return
+
         # Start the camera stream
         while True:
             try:
                 print("Starting safety monitor...")
-                self.pipeline.start(self.config)
+                profile = self.pipeline.start(self.config)
+                self.camera_model = CameraModel.from_profile(profile, self.align_to)
                 break
             except KeyboardInterrupt:
                 print("Stopped by user.")
@@ -86,6 +122,9 @@ class SafetyMonitor:
 
     def stop_monitoring(self):
         """Stop the pipeline."""
+        if self.source is not None:
+            self.source.stop()
+            return
         self.pipeline.stop()
 
     @staticmethod
@@ -97,12 +136,6 @@ class SafetyMonitor:
             + (point1[2] - point2[2]) ** 2
         )
 
-    def calculate_distance_to_sphere(self, point):
-        """Calculate distance from a point to the surface of the sphere."""
-        distance_to_center = np.linalg.norm(np.array(point) - self.sphere_center)
-        distance_to_surface = abs(distance_to_center - self.sphere_radius)
-        return distance_to_surface
-
     def apply_landmark_overlay(
         self, color_image: np.ndarray, results: NamedTuple
     ) -> None:
@@ -162,7 +195,28 @@ class SafetyMonitor:
 
         return Rz @ Ry @ Rx  # Combined rotation matrix: R = Rz * Ry * Rx
 
+    def get_robot_state(self, timestamp=None):
+        """
+        TCP pose and joint positions from the same pushed sample, falls back
+        to asking the server when no recent sample arrived.
+
+        Parameters:
+        timestamp (float): Frame time, the robot state is interpolated to it when given.
+        """
+        state = None
+        if timestamp:
+            state = self.robot_controller.get_robot_state_at(timestamp)
+        if state is None:
+            state = self.robot_controller.get_robot_state(max_age=ROBOT_STATE_MAX_AGE)
+        if state is not None:
+            return state.tcp_pose, state.q
+        return self.get_tcp_coords(), self.get_joint_positions()
+
     def get_tcp_coords(self):
+        state = self.robot_controller.get_robot_state(max_age=ROBOT_STATE_MAX_AGE)
+        if state is not None:
+            return state.tcp_pose
+
         while True:
             tcp_coords = self.robot_controller.get_tcp_pose()
             if tcp_coords is None:
@@ -171,50 +225,75 @@ class SafetyMonitor:
             break
         return tcp_coords
 
+    def get_joint_positions(self):
+        state = self.robot_controller.get_robot_state(max_age=ROBOT_STATE_MAX_AGE)
+        if state is not None:
+            return state.q
+
+        while True:
+            joint_positions = self.robot_controller.get_actual_q()
+            if joint_positions is None:
+                print("Joint positions is none")
+                continue
+            break
+        return joint_positions
+
     def calculate_human_robot_distance(
-        self, poses: NamedTuple, depth_frame: rs.depth_frame, color_image: np.ndarray
+        self,
+        poses: NamedTuple,
+        depth_image: np.ndarray,
+        color_image: np.ndarray,
+        timestamp: float = None,
     ) -> float:
-        """Calculate the minimum distance between the human and the robot"""
+        """Calculate the minimum distance between the human and the robot, at the robot pose of the frame timestamp"""
         min_distance = float("inf")
+        self.landmark_distances = []
+
+        actual_tcp_coords, actual_joint_positions = self.get_robot_state(timestamp)
 
-        actual_tcp_coords = self.get_tcp_coords()
-        tcp_coords = calculate_camera_tcp_coords(actual_tcp_coords)
+        # Capsule chain of the robot links in the camera frame
+        link_points = self.camera_transform.to_camera(
+            self.robot_model.link_points(actual_joint_positions, actual_tcp_coords)
+        )
 
         if poses.pose_landmarks:
             height, width, _ = color_image.shape
 
-            depth_intrin = depth_frame.profile.as_video_stream_profile().intrinsics
-            
-            # Check distance for each human landmark
-            for id, landmark in enumerate(poses.pose_landmarks.landmark):
-                if id >= 24:  # Ignore leg landmarks
-                    break
+            # Pixel coordinates of all upper body landmarks (legs are ignored)
+            pixels = landmarks_to_pixels(poses.pose_landmarks.landmark, width, height)
+
+            # Ensure the coordinates are within the bounds of the image
+            in_bounds = self.camera_model.in_bounds(pixels)
+            ids = np.flatnonzero(in_bounds)
+            pixels = pixels[in_bounds]
+            if len(pixels) == 0:
+                return min_distance
 
-                cx = int(landmark.x * width)
-                cy = int(landmark.y * height)
+            # Sample a robust depth for all landmarks at once, landmarks without
+            # any valid depth around them (edges, flying pixels) are skipped
+            depths = self.camera_model.median_depth_at(depth_image, pixels)
+            has_depth = depths > 0
+            ids = ids[has_depth]
+            pixels = pixels[has_depth]
+            depths = depths[has_depth]
+            if len(pixels) == 0:
+                return min_distance
 
-                # Ensure the coordinates are within the bounds of the image
-                if 0 <= cx < width and 0 <= cy < height:
-                    depth_value = depth_frame.get_distance(cx, cy)
-                    human_coords = rs.rs2_deproject_pixel_to_point(
-                        depth_intrin, [cx, cy], depth_value
-                    )
+            # Deproject all landmarks into the camera frame
+            human_coords = self.camera_model.deproject(pixels, depths)
 
-                    
-                    distance = math.dist(human_coords, tcp_coords[:3])
+            # Distance from every landmark to the closest robot link
+            distances = self.robot_model.distances(human_coords, link_points)
 
-                    cv2.putText(color_image, f"{id}: {distance:0.02f}", (cx, cy),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,0), 2, cv2.LINE_AA)
-                    min_distance = min(
-                        min_distance, distance
-                    )  # Track the minimum distance
+            self.landmark_distances = list(zip(ids, pixels, distances))
+            min_distance = float(distances.min())  # Track the minimum distance
 
         return min_distance
 
     @staticmethod
-    def _draw_tcp_on_image(tcp_coords, depth_intrin, color_image):
+    def _draw_tcp_on_image(tcp_coords, camera_model, color_image):
         """Draws the TCP on the image at the correct pixel coordinates."""
-        tcp_pixel_coords = rs.rs2_project_point_to_pixel(depth_intrin, tcp_coords)
+        tcp_pixel_coords = camera_model.project(tcp_coords)[0]
         tcp_x, tcp_y = int(tcp_pixel_coords[0]), int(tcp_pixel_coords[1])
         height, width, _ = color_image.shape
 
@@ -222,23 +301,41 @@ class SafetyMonitor:
             cv2.circle(color_image, (tcp_x, tcp_y), 10, (0, 0, 255), -1)  # Red circle
             cv2.putText(color_image, "TCP", (tcp_x + 15, tcp_y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
 
+    def draw_landmark_distances(self, color_image):
+        """Draw the distance of each landmark from the last distance calculation"""
+        for id, (cx, cy), distance in self.landmark_distances:
+            cv2.putText(color_image, f"{id}: {distance:0.02f}", (int(cx), int(cy)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,0), 2, cv2.LINE_AA)
+        return color_image
+
     def draw_distance_on_screen(self, color_image, distance):
         """Draw the distance on the screen in the top left corner"""
         cv2.putText(color_image, f"Distance: {distance:0.02f}", (50, 50),
                         cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,0), 2, cv2.LINE_AA)
 
-    def draw_tcp_on_frame(self, color_image, depth_frame):
+    def draw_tcp_on_frame(self, color_image):
         """draw tcp on the color_image frame"""
         tcp_coords = self.get_tcp_coords()
-        tcp_coords = calculate_camera_tcp_coords(tcp_coords)
-        depth_intrin = depth_frame.profile.as_video_stream_profile().intrinsics
-        self._draw_tcp_on_image(tcp_coords[:3], depth_intrin, color_image)
+        tcp_coords = self.camera_transform.poses_to_camera(tcp_coords)
+        self._draw_tcp_on_image(tcp_coords, self.camera_model, color_image)
 
     def calculate_poses(self, color_image: np.ndarray) -> NamedTuple:
-        rgb_image = cv2.cvtColor(color_image, cv2.COLOR_BGR2RGB)
-        return self.pose.process(
-            rgb_image
-        )  # Used for creating pose overlay, calculating distance between human and robot
+        if self.pose_tracker is None:
+            rgb_image = cv2.cvtColor(color_image, cv2.COLOR_BGR2RGB)
+            return self.pose.process(
+                rgb_image
+            )  # Used for creating pose overlay, calculating distance between human and robot
+
+        # Tracking mode, landmarks are mapped back into full frame coordinates
+        height, width, _ = color_image.shape
+        region_image, region = self.pose_tracker.crop(color_image)
+        rgb_image = cv2.cvtColor(region_image, cv2.COLOR_BGR2RGB)
+        if region != self._pose_region:
+            # The video mode graph tracks landmarks from frame to frame, start it over when the crop geometry changes
+            self.pose.reset()
+            self._pose_region = region
+        poses = self.pose.process(rgb_image)
+        return self.pose_tracker.update(poses, region, width, height)
 
     def apply_some_graphic(
         self, color_image: np.ndarray, patch_coords_list: List[List[float]]
@@ -275,12 +372,8 @@ class SafetyMonitor:
 
     def get_frames(self) -> SafetyFrameResults:
         """Get the latest frames from the safety monitor"""
-        if self.robot_pose_state == 1:
-            self.sphere_center = self.sphere_center_fixtures
-        elif self.robot_pose_state == 2:
-            self.sphere_center = self.sphere_center_place
-        else:
-            self.sphere_center = self.sphere_center_home
+        if self.source is not None:
+            return self.source.get_frames()
 
         # Get frames from the RealSense camera
 
@@ -291,7 +384,16 @@ class SafetyMonitor:
                 frames = self.pipeline.wait_for_frames()
             except Exception:
                 time.sleep(0.05)
-        aligned_frames = self.align.process(frames)
+        # Only host clock based timestamps can be compared with the robot states
+        color_frame = frames.get_color_frame()
+        if color_frame.get_frame_timestamp_domain() in (rs.timestamp_domain.global_time, rs.timestamp_domain.system_time):
+            timestamp = color_frame.get_timestamp() / 1000
+            self.latency.record("capture", time.time() - timestamp)  # Exposure until the frames reached us
+        else:
+            timestamp = time.time()
+
+        with self.latency.measure("align"):
+            aligned_frames = self.align.process(frames)
 
         depth_frame = aligned_frames.get_depth_frame()
         color_frame = aligned_frames.get_color_frame()
@@ -300,7 +402,7 @@ class SafetyMonitor:
         color_image = np.asanyarray(color_frame.get_data())
         depth_image = np.asanyarray(depth_frame.get_data())
 
-        return SafetyFrameResults(color_frame, color_image, depth_frame, depth_image)
+        return SafetyFrameResults(color_frame, color_image, depth_frame, depth_image, timestamp=timestamp)
 
 
 def main():
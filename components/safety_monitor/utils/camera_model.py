@@ -0,0 +1,143 @@
+import numpy as np
+
+
+class CameraModel:
+    """
+    Cached pinhole model of the aligned depth stream.
+
+    The intrinsics are read once from the pipeline profile and a per pixel ray
+    lookup table is precomputed, so deprojecting a pixel is only a multiply by
+    its depth. Most aligned D4xx color streams have zero distortion
+    coefficients and the pinhole table is exact. Streams that report a
+    distortion model get a table built with rs.rs2_deproject_pixel_to_point
+    instead, see from_profile. project() is always pinhole, it is only used
+    for drawing.
+    """
+
+    def __init__(self, intrinsics, depth_scale=0.001, depth_window=5, rays=None):
+        """
+        Parameters:
+        intrinsics: RealSense intrinsics (anything with width, height, fx, fy, ppx and ppy).
+        depth_scale (float): Meters per unit of the z16 depth image.
+        depth_window (int): Size k of the kxk window used by median_depth_at.
+        rays (numpy.ndarray): HxWx2 ray table to use instead of the pinhole one.
+        """
+        self.intrinsics = intrinsics
+        self.depth_scale = depth_scale
+        self.width = intrinsics.width
+        self.height = intrinsics.height
+        self.fx, self.fy = intrinsics.fx, intrinsics.fy
+        self.ppx, self.ppy = intrinsics.ppx, intrinsics.ppy
+
+        # HxWx2 table of normalized (x, y) ray coordinates for each pixel
+        if rays is not None:
+            self.rays = np.asarray(rays, dtype=np.float32)
+        else:
+            ray_x = (np.arange(self.width, dtype=np.float32) - self.ppx) / self.fx
+            ray_y = (np.arange(self.height, dtype=np.float32) - self.ppy) / self.fy
+            self.rays = np.empty((self.height, self.width, 2), dtype=np.float32)
+            self.rays[:, :, 0] = ray_x[np.newaxis, :]
+            self.rays[:, :, 1] = ray_y[:, np.newaxis]
+
+        # Precomputed (dx, dy) offsets of a kxk window centered on a pixel
+        half = depth_window // 2
+        offsets = np.arange(-half, depth_window - half, dtype=np.int32)
+        self.window_dx = np.tile(offsets, depth_window)
+        self.window_dy = np.repeat(offsets, depth_window)
+
+    @classmethod
+    def from_profile(cls, profile, stream=None):
+        """
+        Creates the camera model from a started rs.pipeline_profile.
+
+        The depth frames are aligned to the color stream, so the color intrinsics
+        are the ones that describe the aligned depth image.
+        """
+        import pyrealsense2 as rs
+
+        if stream is None:
+            stream = rs.stream.color
+        intrinsics = profile.get_stream(stream).as_video_stream_profile().get_intrinsics()
+        depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+
+        rays = None
+        if any(intrinsics.coeffs):
+            # The pinhole table would be off towards the image borders, let librealsense
+            # undistort every pixel once instead
+            print(f"Stream has {intrinsics.model} coefficients {list(intrinsics.coeffs)}, building the distorted ray table")
+            rays = np.empty((intrinsics.height, intrinsics.width, 2), dtype=np.float32)
+            for y in range(intrinsics.height):
+                for x in range(intrinsics.width):
+                    rays[y, x] = rs.rs2_deproject_pixel_to_point(intrinsics, [x, y], 1.0)[:2]
+        return cls(intrinsics, depth_scale, rays=rays)
+
+    def depth_at(self, depth_image, pixels):
+        """Returns the depth in meters at each of the Nx2 (x, y) pixels."""
+        return depth_image[pixels[:, 1], pixels[:, 0]] * np.float32(self.depth_scale)
+
+    def median_depth_at(self, depth_image, pixels):
+        """
+        Returns a robust depth in meters for each of the Nx2 (x, y) pixels.
+
+        A kxk window around every pixel is gathered with a single np.take, zero
+        (missing) depth values are rejected and the median of the remaining values
+        is returned. Pixels without any valid depth in their window get 0.
+        """
+        xs = np.clip(pixels[:, 0, np.newaxis] + self.window_dx, 0, self.width - 1)
+        ys = np.clip(pixels[:, 1, np.newaxis] + self.window_dy, 0, self.height - 1)
+        window = np.take(depth_image, ys * self.width + xs).astype(np.float32)
+
+        # Push missing values to the end of each sorted row
+        window[window == 0] = np.inf
+        window.sort(axis=1)
+        valid = np.count_nonzero(np.isfinite(window), axis=1)
+
+        lower = np.maximum(valid - 1, 0) // 2
+        upper = valid // 2
+        median = (
+            np.take_along_axis(window, lower[:, np.newaxis], axis=1)[:, 0]
+            + np.take_along_axis(window, upper[:, np.newaxis], axis=1)[:, 0]
+        ) / 2
+        median[valid == 0] = 0
+        return median * np.float32(self.depth_scale)
+
+    def deproject(self, pixels, depths):
+        """
+        Deprojects Nx2 (x, y) pixels with N depths in meters into Nx3 camera points.
+        """
+        depths = np.asarray(depths, dtype=np.float32)
+        points = np.empty((len(pixels), 3), dtype=np.float32)
+        points[:, :2] = self.rays[pixels[:, 1], pixels[:, 0]] * depths[:, np.newaxis]
+        points[:, 2] = depths
+        return points
+
+    def project(self, points):
+        """Projects Nx3 camera points into Nx2 (x, y) pixel coordinates."""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        pixels = np.empty((len(points), 2), dtype=np.float32)
+        pixels[:, 0] = points[:, 0] / points[:, 2] * self.fx + self.ppx
+        pixels[:, 1] = points[:, 1] / points[:, 2] * self.fy + self.ppy
+        return pixels
+
+    def in_bounds(self, pixels):
+        """Returns a boolean mask of the Nx2 pixels that are inside the image."""
+        return (
+            (pixels[:, 0] >= 0)
+            & (pixels[:, 0] < self.width)
+            & (pixels[:, 1] >= 0)
+            & (pixels[:, 1] < self.height)
+        )
+
+
+def landmarks_to_pixels(landmarks, width, height, max_landmarks=24):
+    """
+    Converts normalized MediaPipe landmarks into integer pixel coordinates.
+
+    Returns:
+    numpy.ndarray: Nx2 array of (x, y) pixel coordinates, may be out of bounds.
+    """
+    normalized = np.array(
+        [(landmark.x, landmark.y) for landmark in landmarks[:max_landmarks]],
+        dtype=np.float32,
+    ).reshape(-1, 2)
+    return (normalized * (width, height)).astype(np.int32)
@@ -1,28 +1,123 @@
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import List
+from fastapi import WebSocket
+from collections import deque
+from typing import Dict, List
+import asyncio
+
+
+class _Client:
+    """Send queue, writer task and counters of one websocket"""
+
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.websocket = websocket
+        self.queue = deque(maxlen=max_queue)  # (is_bytes, message), a full deque drops the oldest
+        self.ready = asyncio.Event()
+        self.task = None
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+
+    def stats(self):
+        client = self.websocket.client
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "bytes_sent": self.bytes_sent,
+        }
 
 
 # Keep track of active WebSocket connections
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """
+    Fans messages out to all connected websockets.
+
+    Every client has its own bounded send queue and writer task, so broadcasting
+    never waits on a socket. A slow client skips the oldest queued messages
+    instead of holding up the others.
+    """
+
+    def __init__(self, max_queue: int = 2):
+        """
+        Parameters:
+        max_queue (int): Messages queued per client before the oldest one is dropped.
+        """
+        self.max_queue = max_queue
+        self.clients: Dict[WebSocket, _Client] = {}
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         print("Peer connected")
-        self.active_connections.append(websocket)
+        client = _Client(websocket, self.max_queue)
+        client.task = asyncio.create_task(self._writer(client))
+        self.clients[websocket] = client
 
     def disconnect(self, websocket: WebSocket):
+        # Called by both the endpoint and a failing writer, only the first call does anything
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
         print("Peer disconnected")
-        self.active_connections.remove(websocket)
+        if client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    async def _writer(self, client: _Client):
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                while client.queue:
+                    is_bytes, message = client.queue.popleft()
+                    if is_bytes:
+                        await client.websocket.send_bytes(message)
+                    else:
+                        await client.websocket.send_text(message)
+                    client.sent += 1
+                    client.bytes_sent += len(message) if is_bytes else len(message.encode())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:  # WebSocketDisconnect or a send on a closed socket
+            print(f"Send failed with {e!r}")
+            self.disconnect(client.websocket)
+
+    @staticmethod
+    def _enqueue_to(client: _Client, is_bytes: bool, message):
+        if len(client.queue) == client.queue.maxlen:
+            client.dropped += 1
+        client.queue.append((is_bytes, message))
+        client.ready.set()
+
+    def _enqueue(self, is_bytes: bool, message):
+        for client in list(self.clients.values()):
+            self._enqueue_to(client, is_bytes, message)
+
+    def _send_to(self, websocket: WebSocket, is_bytes: bool, message):
+        client = self.clients.get(websocket)
+        if client is not None:
+            self._enqueue_to(client, is_bytes, message)
+
+    def send_text(self, websocket: WebSocket, message: str):
+        """Queues a message for one client, through its writer like the broadcasts."""
+        self._send_to(websocket, False, message)
+
+    def send_bytes(self, websocket: WebSocket, bs: bytes):
+        """Queues a message for one client, through its writer like the broadcasts."""
+        self._send_to(websocket, True, bs)
+
+    def is_connected(self, websocket: WebSocket) -> bool:
+        """False once the client disconnected or its writer dropped it after a failed send."""
+        return websocket in self.clients
 
     async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        self._enqueue(False, message)
 
     async def broadcast_bytes(self, bs: bytearray):
-        for connection in self.active_connections:
-            try:
-                await connection.send_bytes(bs)
-            except WebSocketDisconnect:
-                self.active_connections.remove(connection)
+        self._enqueue(True, bs)
+
+    def stats(self):
+        """Per client counters of sent and dropped messages and sent bytes"""
+        return [client.stats() for client in list(self.clients.values())]
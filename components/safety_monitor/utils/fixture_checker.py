@@ -3,8 +3,17 @@ import numpy as np
 import pathlib
 import os
 
+from .patch_background import PatchBackgroundModel
+
+# Fixed point weights and shift of OpenCV's COLOR_RGB2GRAY for 8 bit images,
+# so converting only the patch pixels gives the same values as cvtColor.
+# Like the cvtColor call this replaces, they are applied to the channels in
+# order, also for the BGR camera frames.
+GRAY_WEIGHTS = np.array([9798, 19235, 3735], dtype=np.int32)
+GRAY_SHIFT = 15
+
 class CheckFixtures:
-    def __init__(self, patch_coords_list, image_path, intensity_threshold=40, percentage_threshold=35, min_dist=1.2, max_dist=1.8):
+    def __init__(self, patch_coords_list, image_path, intensity_threshold=40, percentage_threshold=35, min_dist=1.2, max_dist=1.8, depth_scale=0.001, adaptive_background=False):
         self.patch_coords_list = patch_coords_list
         self.patch_coords_list = [ # TODO: Fix later
                 (335, 365, 20, 15), 
@@ -19,6 +28,12 @@ class CheckFixtures:
         self.percentage_threshold = percentage_threshold # The minimum percentage of difference required to consider an object detected.
         self.min_dist = min_dist  # Minimum valid distance for object detection
         self.max_dist = max_dist  # Maximum valid distance for object detection
+        self.depth_scale = depth_scale  # Meters per unit of the depth image
+        self._patch_index = None  # Flat pixel indices of all patches, see _patch_indices
+        self._patch_index_shape = None
+        # Compare against a per pixel background model learned from empty fixtures instead of the static reference
+        self.adaptive_background = adaptive_background
+        self.background = None  # PatchBackgroundModel, created together with the patch indices
 
     @staticmethod
     def compare_image_patch(reference_image, current_image, patch_coords, threshold=100):
@@ -136,7 +151,7 @@ class CheckFixtures:
         depth_patch = current_depth_image[y:y+h, x:x+w]
 
         # Calculate the average depth in the patch
-        avg_depth = np.mean(depth_patch) / 1000
+        avg_depth = np.mean(depth_patch) * self.depth_scale
         return avg_depth
 
 
@@ -187,36 +202,127 @@ class CheckFixtures:
             #print(f"Patch {patch_idx + 1}: {avg_depth}")
     
 
+    def _patch_indices(self, shape):
+        """
+        Flat indices of the pixels of all patches, concatenated patch after patch.
+        Computed once per image shape and whenever the patch list changes.
+
+        Returns:
+        - (image_index, reference_values, starts, sizes): indices into the flattened image,
+          the reference pixels at those indices (the pre-cropped reference), the offset of
+          each patch and its pixel count.
+        """
+        key = (shape[:2], tuple(self.patch_coords_list))
+        if self._patch_index_shape == key:
+            return self._patch_index
+
+        image_index, reference_index, sizes = [], [], []
+        for x, y, w, h in self.patch_coords_list:
+            # Clip like slicing does, patches reaching over the border only use the part inside
+            y0, x0 = max(y, 0), max(x, 0)
+            y1 = max(min(y + h, shape[0], self.reference_image.shape[0]), y0)
+            x1 = max(min(x + w, shape[1], self.reference_image.shape[1]), x0)
+            ys, xs = np.mgrid[y0:y1, x0:x1]
+            image_index.append((ys * shape[1] + xs).ravel())
+            reference_index.append((ys * self.reference_image.shape[1] + xs).ravel())
+            sizes.append(ys.size)
+
+        image_index = np.concatenate(image_index)
+        reference_values = self.reference_image.ravel().take(np.concatenate(reference_index)).astype(np.int16)
+        sizes = np.array(sizes)
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        self._patch_index = (image_index, reference_values, starts, sizes)
+        self._patch_index_shape = key
+        if self.adaptive_background:
+            # Starts out as the reference image with the static intensity threshold
+            self.background = PatchBackgroundModel(reference_values, sizes, initial_std=self.intensity_threshold / 3, z_threshold=3)
+        return self._patch_index
+
+    def update_background(self, current_values, empty_patches):
+        """
+        Lets the background model learn from the patches known to be empty.
+
+        Parameters:
+        - current_values: Gray values from patch_gray_values.
+        - empty_patches: Boolean numpy array, True for the patches that are empty.
+        """
+        if self.background is not None:
+            self.background.update(current_values, empty_patches)
+
+    def patch_gray_values(self, current_image):
+        """
+        Grayscale values of the pixels of all patches, concatenated patch after patch.
+        Only the patch pixels are converted instead of the whole frame.
+        """
+        image_index = self._patch_indices(current_image.shape)[0]
+        pixels = current_image.reshape(-1, 3).take(image_index, axis=0).astype(np.int32)
+        return (pixels @ GRAY_WEIGHTS + (1 << (GRAY_SHIFT - 1))) >> GRAY_SHIFT
+
+    def patch_signatures(self, current_values, shape):
+        """
+        Cheap per patch signature of the grayscale values from patch_gray_values.
+
+        Returns:
+        - (means, variances): One value per patch, 0 for patches outside the image.
+        """
+        _, _, starts, sizes = self._patch_indices(shape)
+        non_empty = sizes > 0
+        means = np.zeros(len(sizes))
+        variances = np.zeros(len(sizes))
+        values = current_values.astype(np.float64)
+        means[non_empty] = np.add.reduceat(values, starts[non_empty]) / sizes[non_empty]
+        variances[non_empty] = np.add.reduceat(values * values, starts[non_empty]) / sizes[non_empty] - means[non_empty] ** 2
+        return means, variances
+
+    def evaluate_patches(self, current_values, current_depth_image):
+        """
+        Detection for every patch from the values of patch_gray_values.
+
+        Returns:
+        - A boolean numpy array, True where the patch is full.
+        """
+        image_index, reference_values, starts, sizes = self._patch_indices(current_depth_image.shape)
+        non_empty = sizes > 0
+
+        # Percentage of pixels per patch differing more than the threshold from the reference
+        if self.background is not None:
+            changed = self.background.changed(current_values).astype(np.int32)
+        else:
+            changed = (np.abs(current_values - reference_values) > self.intensity_threshold).astype(np.int32)
+        diff_percentage = np.zeros(len(sizes))
+        diff_percentage[non_empty] = np.add.reduceat(changed, starts[non_empty]) / sizes[non_empty] * 100
+
+        # Average depth per patch in meters
+        depth_values = current_depth_image.ravel().take(image_index).astype(np.float64)
+        avg_depth = np.zeros(len(sizes))
+        avg_depth[non_empty] = np.add.reduceat(depth_values, starts[non_empty]) / sizes[non_empty] * self.depth_scale
+
+        return (
+            non_empty
+            & (diff_percentage > self.percentage_threshold)
+            & (self.min_dist < avg_depth)
+            & (avg_depth < self.max_dist)
+        )
+
     def check_all_patches(self, current_image, current_depth_image):
         """
         Checks if an object has been detected in any of the given patches.
         Additionally uses the depth image to differentiate between detecting the components or the robot.
 
+        All patches are gathered into one array with precomputed indices, so the
+        intensity difference and the average depth of every patch take a single
+        np.add.reduceat each, for any number of patches.
+
         Parameters:
         - current_image: Image with/without the object (numpy array).
         - current_depth_image: Depth image with/without the object (numpy array).
 
         Returns:
-        - A numpy array where each element is 0 (empty) or 1 (full) for the corresponding patch.
+        - A list where each element is 0 (empty) or 1 (full) for the corresponding patch.
         """
-        # Create an empty list to store the results
-        results = []
-
-        current_image = cv2.cvtColor(current_image, cv2.COLOR_RGB2GRAY)
-
-        # Iterate over each patch in the list of patch coordinates
-        for patch_coords in self.patch_coords_list:
-            # Call the function to check if the object is in the patch
-            result = self.check_for_object_intensity_and_depth(current_image, current_depth_image, patch_coords)
-            
-            # Convert the result to 1 (full) or 0 (empty)
-            patch_status = 1 if result else 0
-            
-            # Append the result to the list
-            results.append(patch_status)
-        
-        # Convert the results list to a numpy array and return
-        return results
+        current_values = self.patch_gray_values(current_image)
+        return self.evaluate_patches(current_values, current_depth_image).astype(int).tolist()
 
     def debug_patches(self, image, reference_image, patch_coords):
         for i, patch in enumerate(patch_coords):
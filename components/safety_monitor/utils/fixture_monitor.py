@@ -0,0 +1,126 @@
+from typing import NamedTuple
+import numpy as np
+
+from .fixture_checker import CheckFixtures
+
+
+class FixtureEvent(NamedTuple):
+    """A fixture changed its debounced state"""
+    fixture: int  # Index of the fixture in the patch list
+    full: bool
+    timestamp: float  # Time of the frame the change was confirmed on
+
+
+class FixtureMonitor:
+    """
+    Incremental, debounced fixture state on top of CheckFixtures.
+
+    A patch is only evaluated again when its signature (mean and standard
+    deviation of the grayscale pixels) moved beyond a threshold since its last
+    evaluation. A new result only becomes the fixture state once it held for
+    debounce_frames frames in a row, so single noisy frames or an arm passing
+    over a fixture do not make the state flicker. update() returns events
+    for the transitions only, listeners are called with every new state.
+    """
+
+    def __init__(self, checker: CheckFixtures, mean_threshold=3.0, std_threshold=3.0, debounce_frames=5):
+        """
+        Parameters:
+        checker (CheckFixtures): Does the actual detection.
+        mean_threshold (float): Change of the patch mean (gray levels) that triggers a new evaluation.
+        std_threshold (float): Change of the patch standard deviation that triggers a new evaluation.
+        debounce_frames (int): Frames a new result has to hold before the state changes.
+        """
+        self.checker = checker
+        self.mean_threshold = mean_threshold
+        self.std_threshold = std_threshold
+        self.debounce_frames = debounce_frames
+
+        self.state = None  # Debounced state, numpy bool array with one entry per fixture
+        self.seq = 0  # Increased with every update that changed the state
+        self.last_update = None  # Message describing the last state change, replaced as a whole
+        self._listeners = []
+        self._detected = None  # Last evaluation result of every patch
+        self._means = None  # Signature of every patch at its last evaluation
+        self._stds = None
+        self._pending = None  # Frames the detection has differed from the state
+        self.frames = 0
+        self.evaluations = 0  # Number of patch evaluations, versus frames * patches without gating
+
+    def _reset(self, n_patches):
+        self.state = None
+        self._detected = np.zeros(n_patches, dtype=bool)
+        self._means = np.full(n_patches, np.nan)
+        self._stds = np.full(n_patches, np.nan)
+        self._pending = np.zeros(n_patches, dtype=int)
+
+    def update(self, color_image, depth_image, timestamp=0.0):
+        """
+        Feeds a frame to the monitor.
+
+        Returns:
+        list: FixtureEvent for every fixture whose debounced state changed, the
+        first frame reports the state of all fixtures.
+        """
+        self.frames += 1
+        values = self.checker.patch_gray_values(color_image)
+        means, variances = self.checker.patch_signatures(values, depth_image.shape)
+        stds = np.sqrt(np.maximum(variances, 0))
+        if self._means is None or len(self._means) != len(means):
+            self._reset(len(means))
+
+        # nan signatures (never evaluated) always compare as changed
+        changed = ~(
+            (np.abs(means - self._means) <= self.mean_threshold)
+            & (np.abs(stds - self._stds) <= self.std_threshold)
+        )
+        if changed.any():
+            detected = self.checker.evaluate_patches(values, depth_image)
+            self._detected[changed] = detected[changed]
+            self._means[changed] = means[changed]
+            self._stds[changed] = stds[changed]
+            self.evaluations += int(np.count_nonzero(changed))
+
+        if self.state is not None:
+            # Patches that are empty and also look empty in this frame follow the lighting
+            self.checker.update_background(values, ~self.state & ~self._detected)
+
+        if self.state is None:
+            # Nothing to debounce against yet
+            self.state = self._detected.copy()
+            return self._publish([FixtureEvent(i, bool(full), timestamp) for i, full in enumerate(self.state)], timestamp)
+
+        differs = self._detected != self.state
+        self._pending = np.where(differs, self._pending + 1, 0)
+        flipped = np.flatnonzero(self._pending >= self.debounce_frames)
+        if len(flipped) == 0:
+            return []
+
+        self.state[flipped] = self._detected[flipped]
+        self._pending[flipped] = 0
+        return self._publish([FixtureEvent(int(i), bool(self.state[i]), timestamp) for i in flipped], timestamp)
+
+    def add_listener(self, callback):
+        """Calls callback(last_update) after every state change, from the thread calling update()."""
+        self._listeners.append(callback)
+
+    def _publish(self, events, timestamp):
+        self.seq += 1
+        self.last_update = {
+            "seq": self.seq,
+            "timestamp": timestamp,
+            "fixtures": self.status(),
+            "changed": [{"fixture": event.fixture, "full": event.full} for event in events],
+        }
+        for listener in self._listeners:
+            listener(self.last_update)
+        return events
+
+    def status(self):
+        """The debounced state as a list of 0 (empty) and 1 (full), None before the first frame."""
+        if self.state is None:
+            return None
+        return self.state.astype(int).tolist()
+
+    def stats(self):
+        return {"frames": self.frames, "patch_evaluations": self.evaluations, "seq": self.seq}
@@ -0,0 +1,55 @@
+import threading
+
+
+class LatestFrameBuffer:
+    """
+    Single slot buffer that only ever holds the newest frame.
+
+    The producer publishes a frame by swapping one (sequence, frame) tuple, which
+    is atomic in CPython, so neither put() nor get() takes a lock. A condition is
+    only used to wake up consumers that are waiting for a newer frame.
+    Frames that get overwritten before any consumer read them are counted as dropped.
+    """
+
+    def __init__(self):
+        self._slot = (0, None)  # (sequence number, frame)
+        self._read_seq = 0  # Newest sequence number any consumer has read
+        self._new_frame = threading.Condition()
+        self.published = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        """Replaces the current frame with a newer one and wakes up the consumers."""
+        seq = self._slot[0]
+        if seq > self._read_seq:
+            self.dropped += 1  # Nobody read the frame we are about to overwrite
+
+        self._slot = (seq + 1, frame)
+        self.published += 1
+
+        with self._new_frame:
+            self._new_frame.notify_all()
+
+    def get(self):
+        """Returns the newest (sequence number, frame) without waiting."""
+        slot = self._slot
+        if slot[0] > self._read_seq:
+            self._read_seq = slot[0]
+        return slot
+
+    def wait_for_newer(self, seq, timeout=None):
+        """
+        Blocks until a frame newer than seq is available.
+
+        Returns:
+        tuple: The newest (sequence number, frame). The frame is None if the
+        timeout expired before anything was published.
+        """
+        if self._slot[0] <= seq:
+            with self._new_frame:
+                if not self._new_frame.wait_for(lambda: self._slot[0] > seq, timeout):
+                    return seq, None
+        return self.get()
+
+    def stats(self):
+        return {"published": self.published, "dropped": self.dropped}
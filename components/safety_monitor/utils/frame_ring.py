@@ -0,0 +1,127 @@
+from multiprocessing import shared_memory
+import os
+import uuid
+import numpy as np
+
+# Header layout (int64): n_slots, height, width, newest sequence number, then one sequence number per slot
+_N_SLOTS, _HEIGHT, _WIDTH, _NEWEST = range(4)
+_HEADER_FIELDS = 4
+_WRITING = -1  # Slot sequence number while the slot is being overwritten
+
+
+class SharedFrameRing:
+    """
+    Fixed size ring of preallocated color/depth frame slots in shared memory.
+
+    The capture stage copies each aligned frame pair into the next slot in
+    place and consumers read zero-copy views of it. Every slot carries the
+    sequence number of the frame it holds, so a reader can check with
+    is_valid() whether the slot was overwritten while it was reading it.
+    Other processes can attach to the ring by its name, which is unique per
+    created ring so several monitors (or a benchmark next to a running
+    monitor) never share one.
+    """
+
+    def __init__(self, shm, owner=False):
+        self._shm = shm
+        self._owner = owner
+        self.name = shm.name
+
+        n_slots, height, width = np.ndarray((3,), dtype=np.int64, buffer=shm.buf)
+        self.n_slots = int(n_slots)
+        self.height = int(height)
+        self.width = int(width)
+
+        self._header = np.ndarray((_HEADER_FIELDS + self.n_slots,), dtype=np.int64, buffer=shm.buf)
+        self._slot_seq = self._header[_HEADER_FIELDS:]
+
+        offset = self._header.nbytes
+        color_shape = (self.n_slots, self.height, self.width, 3)
+        self._color = np.ndarray(color_shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+        offset += self._color.nbytes
+        depth_shape = (self.n_slots, self.height, self.width)
+        self._depth = np.ndarray(depth_shape, dtype=np.uint16, buffer=shm.buf, offset=offset)
+
+    @classmethod
+    def create(cls, height, width, n_slots=8, name=None):
+        """
+        Creates the ring, pass its name to the readers in other processes.
+
+        Parameters:
+        name (str): Name of the shared memory segment, by default unique to this process and ring.
+
+        Raises:
+        FileExistsError: A segment with the given name already exists, it is never replaced.
+        """
+        if name is None:
+            name = f"safety_monitor_frames_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        size = (
+            (_HEADER_FIELDS + n_slots) * 8
+            + n_slots * height * width * 3
+            + n_slots * height * width * 2
+        )
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((_HEADER_FIELDS + n_slots,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_N_SLOTS] = n_slots
+        header[_HEIGHT] = height
+        header[_WIDTH] = width
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Attaches to a ring created by another process."""
+        return cls(shared_memory.SharedMemory(name=name))
+
+    def write(self, color_image, depth_image) -> int:
+        """
+        Copies a frame pair into the next slot.
+
+        Returns:
+        int: The sequence number of the written frame.
+        """
+        seq = int(self._header[_NEWEST]) + 1
+        slot = seq % self.n_slots
+
+        self._slot_seq[slot] = _WRITING
+        np.copyto(self._color[slot], color_image)
+        np.copyto(self._depth[slot], depth_image)
+        self._slot_seq[slot] = seq
+        self._header[_NEWEST] = seq
+        return seq
+
+    def newest(self) -> int:
+        """Returns the sequence number of the newest frame, 0 if nothing was written yet."""
+        return int(self._header[_NEWEST])
+
+    def read(self, seq):
+        """
+        Returns zero-copy (color, depth) views of frame seq.
+
+        Returns:
+        tuple: The views, or None if the frame was already overwritten.
+        Check is_valid(seq) after using the views to detect a concurrent overwrite.
+        """
+        if not self.is_valid(seq):
+            return None
+        slot = seq % self.n_slots
+        return self._color[slot], self._depth[slot]
+
+    def is_valid(self, seq) -> bool:
+        """Whether the slot of frame seq still holds that frame."""
+        return seq > 0 and int(self._slot_seq[seq % self.n_slots]) == seq
+
+    def close(self):
+        """Detaches from the ring, the creating process also frees the shared memory. Only the first call does anything."""
+        if self._shm is None:
+            return
+        shm, self._shm = self._shm, None
+        if self._owner:
+            shm.unlink()  # The segment goes away once the last process detached
+        del self._header, self._slot_seq, self._color, self._depth
+        try:
+            shm.close()
+        except BufferError:
+            pass  # Views handed out to consumers are still alive, the mapping is released with them
@@ -0,0 +1,68 @@
+import time
+import math
+
+from shared.speed_zones import FULL_SPEED_DISTANCE
+
+
+class AdaptiveRateScheduler:
+    """
+    Decides how often pose inference runs based on the last human-robot distance.
+
+    Inference runs at max_hz once the human is within near_distance, which is a
+    margin beyond the distance where the state machine starts slowing the robot
+    down, and drops linearly to min_hz at far_distance and beyond. When the
+    person is lost, inference keeps running at max_hz for grace_period seconds,
+    since losing track of someone near the robot is when it matters most. Only
+    after that, with nobody detected, does it drop to min_hz.
+    """
+
+    def __init__(self, min_hz=5, max_hz=30, near_distance=FULL_SPEED_DISTANCE + 0.3, far_distance=2.0, grace_period=2.0):
+        self.min_hz = min_hz
+        self.max_hz = max_hz
+        self.near_distance = near_distance
+        self.far_distance = far_distance
+        self.grace_period = grace_period
+        self.distance = math.inf
+        self._last_seen = None  # time.monotonic() of the last finite distance
+        self.effective_hz = 0.0  # Smoothed rate inference actually ran at
+        self._last_run = None
+
+    def update(self, distance):
+        """Sets the last measured distance to the closest human."""
+        self.distance = distance
+        if math.isfinite(distance):
+            self._last_seen = time.monotonic()
+
+    def rate(self) -> float:
+        """The rate in Hz inference should run at for the last distance."""
+        if not math.isfinite(self.distance):
+            if self._last_seen is not None and time.monotonic() - self._last_seen < self.grace_period:
+                return self.max_hz  # Just lost the person, find them again quickly
+            return self.min_hz
+        if self.distance >= self.far_distance:
+            return self.min_hz
+        if self.distance <= self.near_distance:
+            return self.max_hz
+
+        fraction = (self.far_distance - self.distance) / (self.far_distance - self.near_distance)
+        return self.min_hz + fraction * (self.max_hz - self.min_hz)
+
+    def wait(self):
+        """Sleeps until the next inference is due and records the run."""
+        now = time.monotonic()
+        if self._last_run is not None:
+            delay = self._last_run + 1 / self.rate() - now
+            if delay > 0:
+                time.sleep(delay)
+                now = time.monotonic()
+
+            interval = now - self._last_run
+            self.effective_hz = 0.9 * self.effective_hz + 0.1 / interval
+        self._last_run = now
+
+    def stats(self):
+        return {
+            "target_hz": round(self.rate(), 2),
+            "effective_hz": round(self.effective_hz, 2),
+            "distance": self.distance if math.isfinite(self.distance) else None,
+        }
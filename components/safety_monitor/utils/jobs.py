@@ -1,12 +1,20 @@
+import atexit
 import threading
 import time
 from collections import deque
 import pathlib
 import os
+import numpy as np
 
 from .fixture_checker import CheckFixtures 
-from ..safety_monitor import SafetyFrameResults, SafetyMonitor
+from .fixture_monitor import FixtureMonitor
+from ..safety_monitor import SafetyFrameResults, SafetyPoseResults, SafetyMonitor
 from .thread_safe_queue import ThreadSafeQueue
+from .frame_buffer import LatestFrameBuffer
+from .pose_workers import PoseWorkerPool
+from .frame_ring import SharedFrameRing
+from .inference_scheduler import AdaptiveRateScheduler
+from .jpeg_encoder import JpegEncoder
 
 current_file_path = pathlib.Path(__file__).parent.resolve()
 reference_image_path = os.path.join(current_file_path, "images/reference3.png")
@@ -18,71 +26,207 @@ patch_coords_list = [
         (231, 458, 20, 15), # Component 4
     ]
 
-fixture_checker = CheckFixtures(patch_coords_list, reference_image_path)
+fixture_checker = CheckFixtures(patch_coords_list, reference_image_path, adaptive_background=True)
+# Debounced fixture state, only re-evaluates patches whose pixels changed
+fixture_monitor = FixtureMonitor(fixture_checker)
 
-FixtureStatusQueue = ThreadSafeQueue(2)
+# Only written on fixture transitions, so it holds just the current state
+FixtureStatusQueue = ThreadSafeQueue(1)
 DistanceQueue = ThreadSafeQueue(5)
-ImageStreamQueue = ThreadSafeQueue(2)
+DistanceFrameTimes = ThreadSafeQueue(5)  # Exposure time of the frame of each distance in DistanceQueue
+# Newest overlay image for the stream, encoded once per image by ImageEncoder
+ImageStreamQueue = LatestFrameBuffer()
+ImageEncoder = JpegEncoder(ImageStreamQueue, os.path.join(current_file_path, "../images/loading.jpg"))
+
+# Shared memory ring the capture stage writes every frame into, created in add_frames_to_queues
+FrameRing: SharedFrameRing = None
+# Pose worker processes, only created with pose_workers > 0
+PosePool: PoseWorkerPool = None
+
+# Pose inference rate, adapted to the last human-robot distance
+PoseScheduler = AdaptiveRateScheduler()
+
+# Newest captured frame, shared by all consumers
+LatestFrames = LatestFrameBuffer()
+# Newest frame with its pose landmarks, MediaPipe runs once per frame for all pose consumers
+LatestPoses = LatestFrameBuffer()
+
+def add_frames_to_queues(m: SafetyMonitor, verbose: bool = False, pose_workers: int = 0):
+    """
+    Runs the capture stage and the consumers in their own threads.
+
+    The capture thread only ever keeps the newest aligned frame pair in
+    LatestFrames. Distance, image stream and fixture consumers each pull the
+    newest frame at their own rate, so a slow consumer no longer slows down capture.
+    The pose stage runs MediaPipe once per frame and fans the result out to
+    the distance and image stream consumers through LatestPoses. With
+    pose_workers > 0 the pose stage is spread over that many worker processes.
+    Frames live in the shared memory FrameRing, consumers only get views of it
+    and the pose workers attach to it by its name.
+    """
+    global FrameRing, PosePool
+    if m.camera_model is None:
+        print("The safety monitor has no camera, start() failed or was interrupted")
+        return
+
+    width, height = m.camera_model.width, m.camera_model.height
+    FrameRing = SharedFrameRing.create(height, width)
+    atexit.register(FrameRing.close)
+
+    # Share the cached camera model instead of assuming millimeter depth units
+    fixture_checker.depth_scale = m.camera_model.depth_scale
+
+    if pose_workers > 0:
+        # The workers read the frames straight from the ring
+        PosePool = PoseWorkerPool(pose_workers, FrameRing.name, latency=m.latency)
+        atexit.register(PosePool.close)  # Stop the workers before the ring is unlinked
+        pose_threads = [
+            threading.Thread(target=submit_to_pose_pool, args=(PosePool, LatestFrames, PoseScheduler), daemon=True),
+            threading.Thread(target=collect_from_pose_pool, args=(PosePool, LatestPoses), daemon=True),
+        ]
+    else:
+        pose_threads = [
+            threading.Thread(target=consume_frames, args=(PoseJob, m, LatestFrames, LatestPoses, verbose, PoseScheduler), daemon=True),
+        ]
+
+    threads = pose_threads + [
+        threading.Thread(target=capture_frames, args=(m, FrameRing, LatestFrames, verbose), daemon=True),
+        threading.Thread(target=consume_frames, args=(DistanceJob, m, LatestPoses, DistanceQueue, verbose), daemon=True),
+        threading.Thread(target=consume_frames, args=(ImageStreamJob, m, LatestPoses, ImageStreamQueue, verbose), daemon=True),
+        threading.Thread(target=consume_frames, args=(FixtureJob, m, LatestFrames, FixtureStatusQueue, verbose), daemon=True),
+        threading.Thread(target=ImageEncoder.run, daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
 
-def add_frames_to_queues(m: SafetyMonitor, verbose: bool = False):
+
+def capture_frames(m: SafetyMonitor, ring: SharedFrameRing, buffer: LatestFrameBuffer, verbose: bool = False):
+    """Captures aligned frames as fast as the camera delivers them."""
     while True:
         try:
             frames = m.get_frames()
-            if verbose: 
+            if verbose:
                 print("Got frames")
 
-            if frames:
-                if verbose:
-                    print("Running distance job")
-                DistanceJob(
-                    m,
-                    frames,
-                    DistanceQueue
-                )
-
-            if frames:
-                if verbose:
-                    print("Running Image queue job")
-                ImageStreamJob(m, frames, ImageStreamQueue)
-
-            # Calculate 1 or 0 values of if a fixture is in the fixture holder or not.
-            if frames.color_image is not None and frames.depth_image is not None:
-                fixtures = fixture_checker.check_all_patches(frames.color_image, frames.depth_image)
-            
-            if fixtures is not None:
-                print("Fixtures:")
-                print(fixtures)
-                v = ",".join(map(lambda x: str(x), fixtures))
-                FixtureStatusQueue.put(v)
-
-            else:
-                print("No fixture")
+            # Copy into the ring in place and hand out views, the realsense frames are released here
+            seq = ring.write(frames.color_image, frames.depth_image)
+            color_image, depth_image = ring.read(seq)
+            buffer.put(SafetyFrameResults(None, color_image, None, depth_image, seq, frames.timestamp))
+        except EOFError as e:  # End of a replayed session
+            print(e)
+            break
+        except Exception as e:
+            print(f"Raised in capture_frames: {e}")
 
 
+def consume_frames(job, m: SafetyMonitor, buffer: LatestFrameBuffer, q, verbose: bool = False, scheduler: AdaptiveRateScheduler = None):
+    """
+    Runs job on the newest item of buffer every time a new one has been published.
+    With a scheduler the job runs no more often than the scheduler's rate.
+    """
+    seq = 0
+    while True:
+        if scheduler is not None:
+            scheduler.wait()
+        seq, frames = buffer.wait_for_newer(seq, timeout=1)
+        if frames is None:
+            continue
+        if not is_current(frames):
+            continue  # Overwritten in the ring before we got to it
+
+        if verbose:
+            print(f"Running {job.__name__} on frame {seq}")
+        try:
+            job(m, frames, q)
         except Exception as e:
-            print(f"Raised in add_to_frames: {e}")
+            print(f"Raised in {job.__name__}: {e}")
 
-        time.sleep(1/60)
-        
-def DistanceJob(m: SafetyMonitor, s: SafetyFrameResults, q) -> None:
-    try:
+
+def PoseJob(m: SafetyMonitor, s: SafetyFrameResults, q) -> None:
+    with m.latency.measure("pose"):
         poses = m.calculate_poses(s.color_image)
-        distance = m.calculate_human_robot_distance(
-            poses, s.depth_frame, s.color_image
-        )
-        q.put(distance)
+    q.put(SafetyPoseResults(s, poses))
+
+
+def is_current(s) -> bool:
+    """Whether the ring slot a frame was read from has not been overwritten since."""
+    if isinstance(s, SafetyPoseResults):
+        s = s.frames
+    return FrameRing is None or FrameRing.is_valid(s.frame_number)
+
+
+def submit_to_pose_pool(pool: PoseWorkerPool, buffer: LatestFrameBuffer, scheduler: AdaptiveRateScheduler):
+    """Hands new ring frames to the pose workers at the scheduler's rate, frames are dropped while all workers are busy."""
+    seq = 0
+    while True:
+        scheduler.wait()
+        seq, frames = buffer.wait_for_newer(seq, timeout=1)
+        if frames is not None:
+            pool.submit(frames)
+
+
+def collect_from_pose_pool(pool: PoseWorkerPool, q: LatestFrameBuffer):
+    """Publishes the pose worker results in frame order, frames that failed or never came back are skipped."""
+    while True:
+        for frames, poses in pool.get(timeout=1):
+            q.put(SafetyPoseResults(frames, poses))
+
+
+def DistanceJob(m: SafetyMonitor, s: SafetyPoseResults, q) -> None:
+    try:
+        with m.latency.measure("distance"):
+            distance = m.calculate_human_robot_distance(
+                s.poses, s.frames.depth_image, s.frames.color_image, s.frames.timestamp
+            )
+        if is_current(s):
+            q.put(distance)
+            DistanceFrameTimes.put(s.frames.timestamp)
+            m.latency.record("publish", time.time() - s.frames.timestamp)  # Exposure until the distance is available
+            PoseScheduler.update(distance)
     except Exception as e:
         print(f"#################### {e}")
 
 
 
-def ImageStreamJob(m: SafetyMonitor, s: SafetyFrameResults, q) -> None:
-    # Copy the image array to ensure no race condition/mutation errors
-    color_image = s.color_image.copy()
-    poses = m.calculate_poses(color_image)
-    color_image = m.apply_landmark_overlay(color_image, poses)
-    color_image = m.apply_some_graphic(s.color_image, fixture_checker.patch_coords_list)
-    q.put(s.color_image)
+# Preallocated overlay images, enough that the image being encoded is not drawn over
+_overlay_images = []
+
+
+def _next_overlay_image(shape):
+    if not _overlay_images:
+        _overlay_images.extend(np.empty(shape, dtype=np.uint8) for _ in range(4))
+    _overlay_images.append(_overlay_images.pop(0))
+    return _overlay_images[-1]
+
+
+def ImageStreamJob(m: SafetyMonitor, s: SafetyPoseResults, q) -> None:
+    # Copy the frame out of the ring, the ring views must not be drawn on
+    color_image = _next_overlay_image(s.frames.color_image.shape)
+    np.copyto(color_image, s.frames.color_image)
+    if not is_current(s):
+        return
+
+    color_image = m.apply_landmark_overlay(color_image, s.poses)
+    color_image = m.draw_landmark_distances(color_image)
+    color_image = m.apply_some_graphic(color_image, fixture_checker.patch_coords_list)
+    q.put(color_image)
+
+
+def FixtureJob(m: SafetyMonitor, s: SafetyFrameResults, q) -> None:
+    # Update the debounced 1 or 0 values of if a fixture is in the fixture holder or not.
+    if s.color_image is None or s.depth_image is None:
+        print("No fixture")
+        return
+
+    # A frame overwritten in the ring while reading it only counts as one frame of the debounce
+    events = fixture_monitor.update(s.color_image, s.depth_image, s.timestamp)
+    if events:
+        for event in events:
+            print(f"Fixture {event.fixture + 1}: {'full' if event.full else 'empty'}")
+        v = ",".join(map(lambda x: str(x), fixture_monitor.status()))
+        q.put(v)
 
 def get_queue(q, h: str):
     print(f"{h} {q.get()}")
@@ -100,4 +244,4 @@ if __name__ == "__main__":
         add_frames_to_queues(m)
 
     print(DistanceQueue.get())
-    print(ImageStreamQueue.get())
\ No newline at end of file
+    print(ImageEncoder.latest()[0])
\ No newline at end of file
@@ -0,0 +1,57 @@
+import cv2
+
+from .frame_buffer import LatestFrameBuffer
+
+
+class JpegEncoder:
+    """
+    Encodes the stream images to JPEG in its own thread, once per new image.
+
+    The encoded bytes are cached, so the HTTP endpoint and every websocket
+    client serve the same bytes and the event loop never runs cv2. Until the
+    first image arrives the loading image is served, it is read from disk once.
+    """
+
+    def __init__(self, source: LatestFrameBuffer, loading_image_path, quality=80, scale=0.5):
+        """
+        Parameters:
+        source (LatestFrameBuffer): Buffer the BGR stream images are published to.
+        loading_image_path (str): JPEG served before the first image is encoded.
+        quality (int): JPEG quality, 0-100.
+        scale (float): Images are resized by this factor before encoding.
+        """
+        self.source = source
+        self.quality = quality
+        self.scale = scale
+        with open(loading_image_path, "rb") as image:
+            self.loading_image = image.read()
+        self._latest = (0, self.loading_image)  # (sequence number, JPEG bytes), swapped as a whole
+        self.encoded = 0
+
+    def encode(self, image) -> bytes:
+        if self.scale != 1:
+            image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer.tobytes()
+
+    def run(self):
+        """Encodes every new image of the source, blocks while there is none."""
+        seq = 0
+        while True:
+            seq, image = self.source.wait_for_newer(seq, timeout=1)
+            if image is None:
+                continue
+            try:
+                image_bytes = self.encode(image)
+            except Exception as e:
+                print(f"Raised in JpegEncoder: {e}")
+                continue
+            self._latest = (self._latest[0] + 1, image_bytes)
+            self.encoded += 1
+
+    def latest(self):
+        """
+        Returns:
+        tuple: (sequence number, JPEG bytes) of the newest encoded image, sequence 0 is the loading image.
+        """
+        return self._latest
@@ -21,6 +21,7 @@ from abfilter import ABFilter
 import rtde_control
 import rtde_receive
 import pyrealsense2 as rs
+from tcp_calculations import CameraRobotTransform
 
 
 rtde_c = rtde_control.RTDEControlInterface("192.168.1.100")
@@ -121,48 +122,8 @@ class RobotSafetyMonitor:
 
 <<<<<<< HEAD:utils/safety_monitor_prev.py
 =======
-        # Load ArUco (camera frame) and robot (base frame) poses
-        aruco_poses = self.load_poses('pose_data/aruco_poses.txt')
-        robot_poses = self.load_poses('pose_data/robot_poses.txt')
-
-        # Extract translation and rotation vectors
-        aruco_translations = aruco_poses[:, :3]  # ArUco translation in camera frame
-        aruco_rotations = aruco_poses[:, 3:]     # ArUco rotations (Euler angles) in camera frame
-        robot_translations = robot_poses[:, :3]  # TCP translation in robot base frame
-        robot_rotations = robot_poses[:, 3:]     # TCP rotations (Euler angles) in robot base frame
-
-        # Convert Euler angles to rotation matrices
-        aruco_rot_matrices = np.array([R.from_euler('xyz', rot).as_matrix() for rot in aruco_rotations])
-        robot_rot_matrices = np.array([R.from_euler('xyz', rot).as_matrix() for rot in robot_rotations])
-
-
-        # Perform hand-eye calibration the other way around to find transformation from robot base to camera
-        R_robot2cam, t_robot2cam = cv2.calibrateHandEye(
-            R_gripper2base=aruco_rot_matrices, t_gripper2base=aruco_translations,  # ArUco as gripper-to-base
-            R_target2cam=robot_rot_matrices, t_target2cam=robot_translations        # Robot as target-to-camera
-        )
-
-        # Construct the transformation matrix
-        self.T_robot2cam = np.eye(4)  # Start with a 4x4 identity matrix
-        self.T_robot2cam[:3, :3] = R_robot2cam  # Set the rotation part
-        self.T_robot2cam[:3, 3] = t_robot2cam.flatten()  # Set the translation part
-
-
-    @staticmethod
-    def load_poses(relative_path):
-        abs_path = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(abs_path, relative_path)
-        poses = []
-        print(abs_path)
-        print(f"file path {file_path}")
-        print(f"Files : {os.listdir()}")
-        with open(file_path, 'r') as f:
-            for line in f:
-                line = line.strip().strip('[]')  # Remove brackets and whitespace
-                if line:
-                    pose = list(map(float, line.split()))  # Split on whitespace
-                    poses.append(pose)
-        return np.array(poses)
+        # Robot base -> camera transform from the saved hand-eye calibration, see "python -m safety_monitor.calibrate"
+        self.T_robot2cam = CameraRobotTransform.load_or_default().c_T_b
 
 
     def set_robot_tcp(self, b_p_tcp):
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class PatchBackgroundModel:
+    """
+    Running per pixel mean and variance of the empty fixture patches.
+
+    Replaces the static reference image: a pixel counts as changed when its
+    z-score against the background is above z_threshold. The background is
+    updated with an exponential moving average from patches known to be
+    empty, and only with pixels that still look like background, so a robot
+    arm or hand passing over an empty fixture is not learned into it. This
+    follows slow lighting drift without recapturing the reference image.
+    """
+
+    def __init__(self, reference_values, sizes, initial_std=13.0, min_std=4.0, learning_rate=0.02, z_threshold=3.0):
+        """
+        Parameters:
+        reference_values (numpy.ndarray): Gray values of the reference image at the patch pixels, the initial mean.
+        sizes (numpy.ndarray): Number of pixels of each patch, in the order of reference_values.
+        initial_std (float): Initial standard deviation, initial_std * z_threshold is the starting intensity threshold.
+        min_std (float): Lower bound of the standard deviation, so a very static scene does not flag sensor noise.
+        learning_rate (float): Weight of a new frame in the running mean and variance.
+        z_threshold (float): z-score above which a pixel counts as changed.
+        """
+        self.mean = np.asarray(reference_values, dtype=np.float32).copy()
+        self.var = np.full(len(self.mean), initial_std ** 2, dtype=np.float32)
+        self.min_var = np.float32(min_std ** 2)
+        self.learning_rate = np.float32(learning_rate)
+        self.z_threshold = z_threshold
+        self.patch_of_pixel = np.repeat(np.arange(len(sizes)), sizes)  # Patch index of every pixel
+        self.updates = 0
+
+    def z_scores(self, values):
+        return np.abs(values - self.mean) / np.sqrt(np.maximum(self.var, self.min_var))
+
+    def changed(self, values):
+        """Boolean array, True for the pixels that differ from the background."""
+        return self.z_scores(values) > self.z_threshold
+
+    def update(self, values, empty_patches):
+        """
+        Learns the current values of the background pixels of empty patches.
+
+        Parameters:
+        values (numpy.ndarray): Gray values of all patch pixels.
+        empty_patches (numpy.ndarray): Boolean array, True for the patches known to be empty.
+        """
+        mask = empty_patches[self.patch_of_pixel] & ~self.changed(values)
+        if not mask.any():
+            return
+
+        diff = values[mask] - self.mean[mask]
+        a = self.learning_rate
+        self.mean[mask] += a * diff
+        self.var[mask] = (1 - a) * (self.var[mask] + a * diff * diff)
+        self.updates += 1
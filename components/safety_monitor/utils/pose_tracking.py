@@ -0,0 +1,103 @@
+import numpy as np
+import cv2
+
+
+class PoseRegionTracker:
+    """
+    Picks the image region pose estimation runs on, based on the last skeleton.
+
+    While a person is tracked, only a padded bounding box around the landmarks
+    of the last full frame is cropped (and downscaled if large) instead of the
+    full frame. The region is only placed on the full frame passes and then
+    held, so a video mode pose graph sees the same crop geometry frame after
+    frame. The full frame is searched again every full_frame_interval frames,
+    so a second person walking in is still found, and right away when tracking
+    is lost or the person reaches the edge of the region.
+    """
+
+    def __init__(self, padding=0.5, min_size=160, max_size=480, full_frame_interval=30, min_visibility=0.5, edge_margin=0.05):
+        """
+        Parameters:
+        padding (float): Padding added on each side, as a fraction of the box size.
+        min_size (int): Minimum width and height of the region in pixels.
+        max_size (int): Regions with a longer side are downscaled to this size.
+        full_frame_interval (int): Run on the full frame at least every n frames.
+        min_visibility (float): Landmarks below this visibility do not count for the box.
+        edge_margin (float): A landmark this close to the region edge (fraction of the region) ends the region.
+        """
+        self.padding = padding
+        self.edge_margin = edge_margin
+        self.min_size = min_size
+        self.max_size = max_size
+        self.full_frame_interval = full_frame_interval
+        self.min_visibility = min_visibility
+        self.region = None  # (x0, y0, x1, y1) in pixels for the next frame, None for the full frame
+        self.frames_since_full = 0
+
+    def crop(self, image):
+        """
+        Returns the part of the image pose estimation should run on.
+
+        Returns:
+        tuple: (image, region), region is None when the full frame is used.
+        """
+        if self.region is None or self.frames_since_full >= self.full_frame_interval:
+            self.frames_since_full = 0
+            return image, None
+
+        self.frames_since_full += 1
+        x0, y0, x1, y1 = self.region
+        cropped = image[y0:y1, x0:x1]
+
+        scale = self.max_size / max(x1 - x0, y1 - y0)
+        if scale < 1:
+            size = (int((x1 - x0) * scale), int((y1 - y0) * scale))
+            cropped = cv2.resize(cropped, size, interpolation=cv2.INTER_AREA)
+        return cropped, self.region
+
+    def update(self, results, region, width, height):
+        """
+        Maps the landmarks found in region back into full frame coordinates. On
+        a full frame pass the region for the following frames is placed around them.
+        """
+        if not results.pose_landmarks:
+            self.region = None  # Tracking lost, search the full frame
+            return results
+
+        landmarks = results.pose_landmarks.landmark
+        if region is not None:
+            lo, hi = self.edge_margin, 1 - self.edge_margin
+            if any(
+                landmark.visibility >= self.min_visibility and not (lo <= landmark.x <= hi and lo <= landmark.y <= hi)
+                for landmark in landmarks
+            ):
+                self.region = None  # Leaving the region, place it again on the next (full) frame
+
+            x0, y0, x1, y1 = region
+            for landmark in landmarks:
+                landmark.x = (x0 + landmark.x * (x1 - x0)) / width
+                landmark.y = (y0 + landmark.y * (y1 - y0)) / height
+            return results
+
+        points = np.array(
+            [(landmark.x, landmark.y) for landmark in landmarks if landmark.visibility >= self.min_visibility],
+            dtype=np.float32,
+        ).reshape(-1, 2)
+        if len(points) == 0:
+            self.region = None
+            return results
+
+        points *= (width, height)
+        (bx0, by0), (bx1, by1) = points.min(axis=0), points.max(axis=0)
+        pad_x = max((bx1 - bx0) * self.padding, (self.min_size - (bx1 - bx0)) / 2)
+        pad_y = max((by1 - by0) * self.padding, (self.min_size - (by1 - by0)) / 2)
+
+        self.region = (
+            int(max(bx0 - pad_x, 0)),
+            int(max(by0 - pad_y, 0)),
+            int(min(bx1 + pad_x, width)),
+            int(min(by1 + pad_y, height)),
+        )
+        if self.region[2] - self.region[0] < 2 or self.region[3] - self.region[1] < 2:
+            self.region = None
+        return results
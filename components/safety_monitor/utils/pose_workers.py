@@ -0,0 +1,208 @@
+import multiprocessing as mp
+import queue
+from typing import NamedTuple
+import threading
+import time
+import cv2
+
+from .frame_ring import SharedFrameRing
+
+
+class PoseResults(NamedTuple):
+    """Stands in for the MediaPipe results object of a pose computed in a worker process"""
+    pose_landmarks: object
+
+
+def _pose_worker(ring_name, tasks, results):
+    """
+    Worker process running its own MediaPipe Pose graph.
+
+    Frames are read in place from the shared frame ring by the sequence number
+    given in each task, and the landmarks are sent back serialized, since the
+    MediaPipe results object can not be pickled. A frame that was overwritten
+    in the ring before or during inference, or that the graph raised on, is sent
+    back as failed, so the pool does not wait for it.
+    """
+    import mediapipe
+
+    pose = mediapipe.solutions.pose.Pose()
+    ring = SharedFrameRing.attach(ring_name)
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:  # Shutdown signal
+                break
+
+            frame_number, seq = task
+            start = time.monotonic()
+            try:
+                images = ring.read(seq)
+                if images is None:
+                    raise ValueError(f"frame {seq} was overwritten before inference")
+                rgb_image = cv2.cvtColor(images[0], cv2.COLOR_BGR2RGB)
+                del images
+                if not ring.is_valid(seq):
+                    raise ValueError(f"frame {seq} was overwritten while reading it")
+                poses = pose.process(rgb_image)
+            except Exception as e:
+                print(f"Raised in pose worker: {e}")
+                results.put((frame_number, False, None, time.monotonic() - start))
+                continue
+
+            landmarks = None
+            if poses.pose_landmarks:
+                landmarks = poses.pose_landmarks.SerializeToString()
+            results.put((frame_number, True, landmarks, time.monotonic() - start))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+class PoseWorkerPool:
+    """
+    Runs MediaPipe pose estimation in a pool of worker processes.
+
+    The workers attach to the shared frame ring the capture stage writes into,
+    so only a (frame number, ring sequence number) pair goes through the task
+    queue and frames are never copied for them. Results come back in whatever
+    order the workers finish and are reordered by frame number.
+
+    A frame whose result does not come back within result_timeout (the worker
+    died or the result was lost) or that failed in the worker is skipped, so
+    the following frames are still emitted. Dead workers are restarted.
+    """
+
+    def __init__(self, n_workers, ring_name, frames_per_worker=2, result_timeout=1.0, latency=None):
+        """
+        Parameters:
+        n_workers (int): Number of worker processes.
+        ring_name (str): Name of the SharedFrameRing the submitted frames live in.
+        frames_per_worker (int): Frames in flight per worker, more than one lets a
+            worker pick up the next frame right after finishing one.
+        result_timeout (float): Seconds after which a submitted frame without a result is skipped.
+        latency (LatencyRecorder): Records the inference time of every frame as the "pose" stage.
+        """
+        self.ring_name = ring_name
+        self.max_in_flight = n_workers * frames_per_worker
+        self.result_timeout = result_timeout
+        self.latency = latency
+        self._ctx = mp.get_context("spawn")  # MediaPipe does not survive a fork
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+
+        self._next_frame_number = 0  # Frame number given to the next submitted frame
+        self._next_emit = 0  # Frame number the consumer gets next
+        self._in_flight = {}  # Frame number -> (frame given to submit(), submit time)
+        self._finished = {}  # Frame number -> PoseResults or None if it failed, waiting to be emitted in order
+        self._lock = threading.Lock()
+        self._closed = False
+        self.dropped = 0  # Frames not submitted because max_in_flight frames were in flight
+        self.skipped = 0  # Submitted frames that failed or timed out
+        self.restarts = 0
+
+        self._workers = [self._start_worker() for _ in range(n_workers)]
+
+    def _start_worker(self):
+        worker = self._ctx.Process(
+            target=_pose_worker,
+            args=(self.ring_name, self._tasks, self._results),
+            daemon=True,
+        )
+        worker.start()
+        return worker
+
+    def _restart_dead_workers(self):
+        for i, worker in enumerate(self._workers):
+            if not worker.is_alive():
+                print(f"Pose worker {worker.pid} exited with code {worker.exitcode}, restarting it")
+                self._workers[i] = self._start_worker()
+                self.restarts += 1
+
+    def submit(self, frames) -> bool:
+        """
+        Hands a frame of the ring over to the workers.
+
+        Parameters:
+        frames (SafetyFrameResults): A frame read from the ring, frame_number is its ring sequence number.
+
+        Returns:
+        bool: False if max_in_flight frames are in flight and the frame was dropped.
+        """
+        with self._lock:
+            if len(self._in_flight) >= self.max_in_flight:
+                self.dropped += 1
+                return False
+            frame_number = self._next_frame_number
+            self._next_frame_number += 1
+            self._in_flight[frame_number] = (frames, time.monotonic())
+        self._tasks.put((frame_number, frames.frame_number))
+        return True
+
+    def get(self, timeout=None):
+        """
+        Waits for the next results in frame order.
+
+        Returns:
+        list: (frames, PoseResults) pairs that are ready, in frame number order.
+        Empty if the timeout expired.
+        """
+        from mediapipe.framework.formats import landmark_pb2
+
+        try:
+            frame_number, ok, landmarks, seconds = self._results.get(timeout=timeout)
+        except queue.Empty:
+            frame_number = None
+
+        if not self._closed:
+            self._restart_dead_workers()
+
+        ready = []
+        with self._lock:
+            # A late result of a frame that was already skipped is dropped
+            if frame_number is not None and frame_number in self._in_flight:
+                self._finished[frame_number] = self._parse(landmarks, landmark_pb2) if ok else None
+                if ok and self.latency is not None:
+                    self.latency.record("pose", seconds)
+
+            now = time.monotonic()
+            while self._next_emit in self._in_flight:
+                frames, submitted = self._in_flight[self._next_emit]
+                if self._next_emit in self._finished:
+                    poses = self._finished.pop(self._next_emit)
+                elif now - submitted > self.result_timeout:
+                    poses = None  # Lost with a dead worker or stuck, give up on it
+                else:
+                    break
+
+                del self._in_flight[self._next_emit]
+                self._next_emit += 1
+                if poses is None:
+                    self.skipped += 1
+                else:
+                    ready.append((frames, poses))
+        return ready
+
+    @staticmethod
+    def _parse(landmarks, landmark_pb2):
+        pose_landmarks = None
+        if landmarks is not None:
+            pose_landmarks = landmark_pb2.NormalizedLandmarkList()
+            pose_landmarks.ParseFromString(landmarks)
+        return PoseResults(pose_landmarks)
+
+    def stats(self):
+        return {"dropped": self.dropped, "skipped": self.skipped, "worker_restarts": self.restarts}
+
+    def close(self):
+        """Stops the workers, only the first call does anything."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
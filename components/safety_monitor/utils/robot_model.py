@@ -0,0 +1,135 @@
+import numpy as np
+
+# Denavit-Hartenberg parameters of the UR5e (meters and radians)
+UR5E_DH = {
+    "d": [0.1625, 0, 0, 0.1333, 0.0997, 0.0996],
+    "a": [0, -0.425, -0.3922, 0, 0, 0],
+    "alpha": [np.pi / 2, 0, 0, np.pi / 2, -np.pi / 2, 0],
+}
+
+# The upper arm and forearm do not lie on the DH line between the joint
+# origins, they are offset sideways along the joint axes (ur_description).
+UR5E_SHOULDER_OFFSET = 0.138  # Upper arm, along the shoulder axis from the shoulder origin
+UR5E_ELBOW_OFFSET = 0.131  # Forearm, back along the elbow axis from the upper arm
+
+# Capsule radius of each segment of the chain built by CapsuleRobotModel.link_points,
+# from the base to the tool (meters)
+UR5E_LINK_RADII = [
+    0.08,  # Base -> shoulder
+    0.08,  # Shoulder origin -> upper arm (shoulder offset)
+    0.08,  # Upper arm
+    0.07,  # Elbow, upper arm -> forearm (elbow offset)
+    0.07,  # Forearm
+    0.06,  # Forearm -> wrist 1
+    0.06,  # Wrist 1 -> wrist 2
+    0.05,  # Wrist 2 -> wrist 3
+    0.06,  # Wrist 3 -> TCP (flange and gripper)
+]
+
+
+def forward_kinematics(q, dh=UR5E_DH, return_axes=False):
+    """
+    Computes the origins of all joint frames of the robot.
+
+    Parameters:
+    q (list): The six joint angles in radians (rtde_r.getActualQ()).
+    dh (dict): Denavit-Hartenberg parameters of the robot.
+    return_axes (bool): Also return the z axes of the frames.
+
+    Returns:
+    numpy.ndarray: 7x3 array with the base and the six joint frame origins in the base frame.
+    With return_axes a second 7x3 array with the z axis of each frame.
+    """
+    origins = np.zeros((7, 3))
+    axes = np.zeros((7, 3))
+    axes[0] = (0, 0, 1)
+    T = np.eye(4)
+    for i, theta in enumerate(q):
+        ct, st = np.cos(theta), np.sin(theta)
+        ca, sa = np.cos(dh["alpha"][i]), np.sin(dh["alpha"][i])
+        A = np.array([
+            [ct, -st * ca, st * sa, dh["a"][i] * ct],
+            [st, ct * ca, -ct * sa, dh["a"][i] * st],
+            [0, sa, ca, dh["d"][i]],
+            [0, 0, 0, 1],
+        ])
+        T = T @ A
+        origins[i + 1] = T[:3, 3]
+        axes[i + 1] = T[:3, 2]
+    if return_axes:
+        return origins, axes
+    return origins
+
+
+def capsule_distances(points, starts, ends, radii):
+    """
+    Distance from every point to the surface of every capsule in one broadcast.
+
+    Parameters:
+    points (numpy.ndarray): Nx3 points.
+    starts (numpy.ndarray): Mx3 start points of the capsule segments.
+    ends (numpy.ndarray): Mx3 end points of the capsule segments.
+    radii (numpy.ndarray): M capsule radii.
+
+    Returns:
+    numpy.ndarray: NxM distances, 0 for points inside a capsule.
+    """
+    segments = ends - starts
+    lengths_sq = np.maximum(np.einsum("mk,mk->m", segments, segments), 1e-12)
+
+    to_points = points[:, np.newaxis, :] - starts[np.newaxis, :, :]
+    t = np.clip(np.einsum("nmk,mk->nm", to_points, segments) / lengths_sq, 0, 1)
+    offsets = to_points - t[:, :, np.newaxis] * segments[np.newaxis, :, :]
+    return np.maximum(np.linalg.norm(offsets, axis=2) - radii, 0)
+
+
+class CapsuleRobotModel:
+    """
+    Models the robot arm as a chain of capsules, one per link.
+
+    The capsule end points are the joint origins from the forward kinematics,
+    with the upper arm and forearm moved out to where they really are by the
+    shoulder and elbow offsets along the joint axes, plus the actual TCP
+    position, so the gripper is covered as well.
+    """
+
+    def __init__(self, dh=UR5E_DH, radii=UR5E_LINK_RADII, shoulder_offset=UR5E_SHOULDER_OFFSET, elbow_offset=UR5E_ELBOW_OFFSET):
+        self.dh = dh
+        self.radii = np.asarray(radii, dtype=np.float64)
+        self.shoulder_offset = shoulder_offset
+        self.elbow_offset = elbow_offset
+
+    def link_points(self, q, tcp_position):
+        """
+        Returns:
+        numpy.ndarray: 10x3 capsule chain points in the base frame, len(radii) + 1 of them.
+        """
+        origins, axes = forward_kinematics(q, self.dh, return_axes=True)
+        upper_arm = self.shoulder_offset  # Upper arm offset from the DH line along the shoulder and elbow axes
+        forearm = self.shoulder_offset - self.elbow_offset  # Forearm offset from the DH line
+        return np.vstack([
+            origins[0],  # Base
+            origins[1],  # Shoulder
+            origins[1] + upper_arm * axes[1],  # Upper arm start
+            origins[2] + upper_arm * axes[1],  # Upper arm end at the elbow
+            origins[2] + forearm * axes[2],  # Forearm start
+            origins[3] + forearm * axes[3],  # Forearm end, in line with wrist 1
+            origins[4],
+            origins[5],
+            origins[6],
+            np.asarray(tcp_position)[:3],
+        ])
+
+    def distances(self, points, link_points):
+        """
+        Minimum distance from every point to the robot.
+
+        Parameters:
+        points (numpy.ndarray): Nx3 points.
+        link_points (numpy.ndarray): Capsule chain points in the same frame as points.
+
+        Returns:
+        numpy.ndarray: N distances to the closest capsule surface.
+        """
+        distances = capsule_distances(points, link_points[:-1], link_points[1:], self.radii)
+        return distances.min(axis=1)
@@ -0,0 +1,221 @@
+"""
+Recording and replay of safety monitor sessions.
+
+A session is a directory with:
+    meta.json       Resolution, fps, depth scale and the intrinsics of the aligned stream
+    frames.jsonl    One line per frame: index, timestamp, TCP pose and joint positions
+    frames/         Lossless PNG color (BGR) and 16 bit depth images of every frame
+"""
+import json
+import os
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from .camera_model import CameraModel
+from ..safety_monitor import SafetyFrameResults
+from shared.pose_history import PoseHistory
+from socket_robot_controller.client import RobotState
+
+SESSION_FORMAT_VERSION = 1
+
+
+def _frame_paths(path, index):
+    return (
+        os.path.join(path, "frames", f"{index:06d}_color.png"),
+        os.path.join(path, "frames", f"{index:06d}_depth.png"),
+    )
+
+
+def load_session_frames(path):
+    """Returns the frames.jsonl entries of a session."""
+    with open(os.path.join(path, "frames.jsonl"), "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class SessionRecorder:
+    """
+    Writes aligned color/depth frames and the matching robot state of a session to disk.
+
+    The PNG encoding runs in writer threads, so the capture loop only copies the
+    images. write() blocks once max_pending frames are waiting to be written.
+    """
+
+    def __init__(self, path, camera_model: CameraModel, fps=15, writers=2, max_pending=30, png_compression=1):
+        """
+        Parameters:
+        writers (int): Number of threads encoding and writing the PNG images.
+        max_pending (int): Frames queued for the writers before write() blocks.
+        png_compression (int): cv2.IMWRITE_PNG_COMPRESSION, 0-9, low values are faster.
+        """
+        self.path = path
+        self.count = 0
+        self.png_params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        os.makedirs(os.path.join(path, "frames"), exist_ok=True)
+
+        intrinsics = camera_model.intrinsics
+        meta = {
+            "version": SESSION_FORMAT_VERSION,
+            "width": camera_model.width,
+            "height": camera_model.height,
+            "fps": fps,
+            "depth_scale": camera_model.depth_scale,
+            "intrinsics": {
+                key: getattr(intrinsics, key) for key in ("width", "height", "fx", "fy", "ppx", "ppy")
+            },
+        }
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        self._index_file = open(os.path.join(path, "frames.jsonl"), "w")
+
+        self._pending = queue.Queue(max_pending)
+        self._writers = [threading.Thread(target=self._write_images, daemon=True) for _ in range(writers)]
+        for writer in self._writers:
+            writer.start()
+
+    def _write_images(self):
+        while True:
+            item = self._pending.get()
+            if item is None:  # Shutdown signal
+                break
+            index, color_image, depth_image = item
+            color_path, depth_path = _frame_paths(self.path, index)
+            cv2.imwrite(color_path, color_image, self.png_params)
+            cv2.imwrite(depth_path, depth_image, self.png_params)
+
+    def write(self, frames: SafetyFrameResults, tcp_pose, q):
+        # Copies, the camera images are only valid until the next frames arrive
+        self._pending.put((self.count, frames.color_image.copy(), frames.depth_image.copy()))
+
+        entry = {
+            "index": self.count,
+            "timestamp": frames.timestamp,
+            "tcp_pose": [float(v) for v in tcp_pose],
+            "q": [float(v) for v in q],
+        }
+        self._index_file.write(json.dumps(entry) + "\n")
+        self.count += 1
+
+    def close(self):
+        """Waits until all queued frames are written."""
+        for _ in self._writers:
+            self._pending.put(None)
+        for writer in self._writers:
+            writer.join()
+        self._index_file.close()
+
+
+class ReplaySource:
+    """
+    Stands in for the RealSense pipeline of the SafetyMonitor and delivers the
+    frames of a recorded session, either at the recorded rate or as fast as possible.
+
+    The recorded timestamps are shifted by time_offset onto the current clock,
+    set at the start of every pass, so frame ages (latency stages, distance_age)
+    are measured like for live frames. As fast as possible replays run ahead
+    of the clock, only realtime replays give meaningful ages.
+    """
+
+    def __init__(self, path, realtime=True, loop=False):
+        """
+        Parameters:
+        path (str): Session directory.
+        realtime (bool): Deliver frames at the recorded timestamps, otherwise as fast as possible.
+        loop (bool): Start over at the end of the session instead of raising EOFError.
+        """
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != SESSION_FORMAT_VERSION:
+            raise ValueError(f"Unsupported session version {self.meta.get('version')} in {path}")
+        self.frames = load_session_frames(path)
+        self.index = 0
+        self.current_timestamp = None  # Shifted timestamp of the last delivered frame
+        self.time_offset = 0.0  # Added to the recorded timestamps, current time minus the first one of the pass
+        self._started = None  # (monotonic time, first timestamp) of the current pass
+
+    def start(self) -> CameraModel:
+        """Returns the camera model of the recorded stream, like SafetyMonitor.start() gets from the profile."""
+        intrinsics = SimpleNamespace(**self.meta["intrinsics"])
+        return CameraModel(intrinsics, self.meta["depth_scale"])
+
+    def get_frames(self) -> SafetyFrameResults:
+        if self.index >= len(self.frames):
+            if not self.loop:
+                raise EOFError(f"Replay of {self.path} finished")
+            self.index = 0
+            self._started = None
+
+        entry = self.frames[self.index]
+        if self._started is None:
+            self._started = (time.monotonic(), entry["timestamp"])
+            self.time_offset = time.time() - entry["timestamp"]
+        if self.realtime:
+            start_time, first_timestamp = self._started
+            delay = start_time + (entry["timestamp"] - first_timestamp) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        color_path, depth_path = _frame_paths(self.path, entry["index"])
+        color_image = cv2.imread(color_path, cv2.IMREAD_COLOR)
+        depth_image = cv2.imread(depth_path, cv2.IMREAD_UNCHANGED)
+
+        self.index += 1
+        self.current_timestamp = entry["timestamp"] + self.time_offset
+        return SafetyFrameResults(None, color_image, None, depth_image, timestamp=self.current_timestamp)
+
+    def stop(self):
+        pass
+
+
+class ReplayRobotController:
+    """
+    Stands in for the RobotSocketClient of the SafetyMonitor and serves the
+    robot states recorded with a session, at the time of the frame being replayed.
+    Timestamps are in the shifted clock of the source, like the frames.
+    """
+
+    def __init__(self, path, source: ReplaySource = None):
+        """
+        Parameters:
+        path (str): Session directory.
+        source (ReplaySource): Source replaying the session, get_robot_state() follows its current frame.
+        """
+        self.source = source
+        frames = load_session_frames(path)
+        self.state_history = PoseHistory(12, capacity=max(len(frames), 1), nearest=slice(3, 6))
+        for entry in frames:
+            self.state_history.append(entry["timestamp"], np.concatenate([entry["tcp_pose"], entry["q"]]))
+
+    def subscribe_robot_state(self):
+        pass
+
+    def get_robot_state_at(self, timestamp):
+        time_offset = self.source.time_offset if self.source is not None else 0.0
+        values = self.state_history.interpolate(timestamp - time_offset)
+        if values is None:
+            return None
+        return RobotState(timestamp, time.monotonic(), list(values[:6]), list(values[6:]))
+
+    def get_robot_state(self, max_age=None):
+        if self.source is not None and self.source.current_timestamp is not None:
+            return self.get_robot_state_at(self.source.current_timestamp)
+        latest = self.state_history.latest()
+        if latest is None:
+            return None
+        time_offset = self.source.time_offset if self.source is not None else 0.0
+        return self.get_robot_state_at(latest[0] + time_offset)
+
+    def get_tcp_pose(self):
+        state = self.get_robot_state()
+        return state.tcp_pose if state is not None else None
+
+    def get_actual_q(self):
+        state = self.get_robot_state()
+        return state.q if state is not None else None
@@ -1,3 +1,6 @@
+import json
+import os
+import pathlib
 import numpy as np
 
 def rotation_matrix_from_euler_angles(roll, pitch, yaw, degrees=False):
@@ -65,31 +68,105 @@ def transform_R(rotation, degrees=False):
 
     return R_mat
 
-def calculate_camera_tcp_coords(actual_tcp_pose):
-    # Example usage:
-    w_t_b = np.array([-0.276, 0.024, -0.035, 0, 0, 0]) # Translation (x, y, z)
-    #w_t_b = np.array([-0.10, -0.276, -0.035, 0, 0, 0]) # Translation (x, y, z)
+# Robot base in the world frame, measured by hand
+W_T_B_TRANSLATION = np.array([-0.276, 0.024, -0.035]) # Translation (x, y, z)
+W_R_B_EULER = (0, 180, 67.5)  # Rotation (roll, pitch, yaw) in degrees
 
-    w_R_b = transform_R([0, 180, 67.5], degrees=True)  # Rotation (roll, pitch, yaw) in degrees
-    #w_R_b = transform_R([0, 180, -112.5], degrees=True)  # Rotation (roll, pitch, yaw) in degrees
+# World (calibration board) in the camera frame
+C_T_W = np.array([[ 0.51970216,  0.854174,    0.01645907, -0.53570101],
+                  [-0.59055939,  0.34525865,  0.72936413,  0.40769184],
+                  [ 0.61733134, -0.38878397,  0.68387034,  1.36497584],
+                  [ 0,           0,           0,           1,        ]])
 
+# Written by "python -m safety_monitor.calibrate"
+CALIBRATION_FORMAT_VERSION = 1
+DEFAULT_CALIBRATION_PATH = os.path.join(
+    pathlib.Path(__file__).parent.parent.resolve(), "calibration/camera_robot.json"
+)
 
-    b_p_tcp = actual_tcp_pose #np.array([-0.08, -0.278, -0.151, 1.718, -2.631, -0.023]) 
-    # placeholder rtde_c.getActualTCPPose()
 
-    w_p_tcp = w_R_b @ b_p_tcp + w_t_b
+class CameraRobotTransform:
+    """
+    Rigid transform between the robot base frame and the camera frame.
 
-    c_T_w = np.array([[ 0.51970216,  0.854174,    0.01645907, -0.53570101],
-                    [-0.59055939,  0.34525865,  0.72936413,  0.40769184],
-                    [ 0.61733134, -0.38878397,  0.68387034,  1.36497584],
-                    [ 0,           0,           0,           1,        ]])
+    The base -> world -> camera chain is composed into a single 4x4 matrix once,
+    so transforming points is one matrix product, also for many points at a time.
+    """
 
-    c_R_w = np.zeros((6, 6))
-    c_R_w[:3, :3] = c_T_w[:3,:3]
-    c_R_w[3:, 3:] = c_T_w[:3,:3]
+    def __init__(self, c_T_b):
+        """
+        Parameters:
+        c_T_b (numpy.ndarray): 4x4 transform from the robot base frame to the camera frame.
+        """
+        self.c_T_b = np.asarray(c_T_b, dtype=np.float64)
+        self.b_T_c = np.linalg.inv(self.c_T_b)
+
+    @classmethod
+    def from_world(cls, w_t_b=W_T_B_TRANSLATION, w_euler_b=W_R_B_EULER, c_T_w=C_T_W):
+        """Composes the transform from the base pose in the world frame and the world pose in the camera frame."""
+        w_T_b = np.eye(4)
+        w_T_b[:3, :3] = rotation_matrix_from_euler_angles(*w_euler_b, degrees=True)
+        w_T_b[:3, 3] = w_t_b
+        return cls(c_T_w @ w_T_b)
+
+    @classmethod
+    def load(cls, path=DEFAULT_CALIBRATION_PATH):
+        """Loads the transform from a calibration file written by the calibrate command."""
+        with open(path, "r") as f:
+            calibration = json.load(f)
+        if calibration.get("version") != CALIBRATION_FORMAT_VERSION:
+            raise ValueError(f"Unsupported calibration file version {calibration.get('version')} in {path}")
+        return cls(calibration["c_T_b"])
+
+    @classmethod
+    def load_or_default(cls, path=DEFAULT_CALIBRATION_PATH):
+        """Loads the calibration file, falls back to the hand measured transform if there is none."""
+        if not os.path.exists(path):
+            print(f"No calibration found at {path}, using the hand measured transform")
+            return cls.from_world()
+        return cls.load(path)
+
+    @staticmethod
+    def _apply(T, points):
+        points = np.asarray(points, dtype=np.float64)
+        return points @ T[:3, :3].T + T[:3, 3]
+
+    def to_camera(self, b_p_points):
+        """Transforms Nx3 (or single) points from the robot base frame into the camera frame."""
+        return self._apply(self.c_T_b, b_p_points)
+
+    def to_base(self, c_p_points):
+        """Transforms Nx3 (or single) points from the camera frame into the robot base frame."""
+        return self._apply(self.b_T_c, c_p_points)
+
+    def poses_to_camera(self, b_poses):
+        """Transforms the positions of Nx6 TCP poses in the robot base frame into Nx3 camera points."""
+        return self.to_camera(np.asarray(b_poses)[..., :3])
+
+
+# Default transform, loaded from the calibration file on first use instead of at import
+_camera_robot_transform = None
+
+
+def get_camera_robot_transform() -> CameraRobotTransform:
+    """The default transform, from the calibration file if there is one."""
+    global _camera_robot_transform
+    if _camera_robot_transform is None:
+        _camera_robot_transform = CameraRobotTransform.load_or_default()
+    return _camera_robot_transform
 
-    c_t_w = np.zeros(6)
-    c_t_w[:3] = c_T_w[:3, 3]
 
-    c_p_tcp = c_R_w @ w_p_tcp + c_t_w
-    return c_p_tcp
\ No newline at end of file
+def calculate_camera_tcp_coords(actual_tcp_pose):
+    """
+    Transforms a TCP pose from the robot base frame into the camera frame.
+
+    Returns:
+    numpy.ndarray: The 6 element pose, the first three elements are the position in the camera frame.
+    """
+    b_p_tcp = np.asarray(actual_tcp_pose, dtype=np.float64)
+    camera_robot_transform = get_camera_robot_transform()
+
+    c_p_tcp = np.empty(6)
+    c_p_tcp[:3] = camera_robot_transform.to_camera(b_p_tcp[:3])
+    c_p_tcp[3:] = camera_robot_transform.c_T_b[:3, :3] @ b_p_tcp[3:]
+    return c_p_tcp
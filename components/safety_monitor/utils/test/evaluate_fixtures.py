@@ -0,0 +1,125 @@
+"""
+Evaluates the fixture detection over the labelled images in images/.
+
+The images are named image_<components>.png, e.g. image_1_3_5.png has a
+component in fixtures 1, 3 and 5. Every combination of thresholds and patch
+offsets is run over the whole set in a process pool, and accuracy, confusion
+counts and throughput are reported per combination.
+
+Run from the components folder:
+    python -m safety_monitor.utils.test.evaluate_fixtures --intensity 30 40 50 --percentage 25 35 45 --shift 5
+"""
+import argparse
+import itertools
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from safety_monitor.utils.fixture_checker import CheckFixtures
+
+current_file_path = pathlib.Path(__file__).parent.resolve()
+image_dir = os.path.join(current_file_path, "../../images/")
+
+# Set once per worker process by _init_worker
+_images = None
+_depth = None
+_reference_path = None
+
+
+def calculate_answer(image_name, n_fixtures):
+    """Expected 0/1 state of every fixture from the image name"""
+    components_used = image_name.split(".")[0].split("_")[1:]
+    return [1 if str(n) in components_used else 0 for n in range(1, n_fixtures + 1)]
+
+
+def load_labelled_images(directory):
+    """Returns (name, color image) of all image_*.png files, sorted by name."""
+    names = sorted(x for x in os.listdir(directory) if x.startswith("image_") and x.endswith(".png"))
+    return [(name, cv2.imread(os.path.join(directory, name))) for name in names]
+
+
+def _init_worker(images, reference_path):
+    global _images, _depth, _reference_path
+    _images = images
+    _reference_path = reference_path
+    # The labelled set has no depth, so every patch gets a depth inside the valid range
+    height, width = images[0][1].shape[:2]
+    _depth = np.full((height, width), 1500, dtype=np.uint16)
+
+
+def evaluate(params):
+    """
+    Runs the fixture check with one parameter combination over all images.
+
+    Returns:
+    dict: The parameters, confusion counts, exactly matching images and the time taken.
+    """
+    intensity_threshold, percentage_threshold, (dx, dy) = params
+    checker = CheckFixtures([], _reference_path, intensity_threshold, percentage_threshold)
+    checker.patch_coords_list = [(x + dx, y + dy, w, h) for x, y, w, h in checker.patch_coords_list]
+    n_fixtures = len(checker.patch_coords_list)
+
+    tp = fp = tn = fn = exact = 0
+    start = time.perf_counter()
+    for name, color_image in _images:
+        detected = np.array(checker.check_all_patches(color_image, _depth), dtype=bool)
+        expected = np.array(calculate_answer(name, n_fixtures), dtype=bool)
+        tp += int(np.count_nonzero(detected & expected))
+        fp += int(np.count_nonzero(detected & ~expected))
+        tn += int(np.count_nonzero(~detected & ~expected))
+        fn += int(np.count_nonzero(~detected & expected))
+        exact += bool((detected == expected).all())
+    elapsed = time.perf_counter() - start
+
+    return {
+        "intensity_threshold": intensity_threshold,
+        "percentage_threshold": percentage_threshold,
+        "shift": (dx, dy),
+        "tp": tp, "fp": fp, "tn": tn, "fn": fn,
+        "accuracy": (tp + tn) / max(tp + fp + tn + fn, 1),
+        "exact": exact,
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate fixture detection over the labelled images.")
+    parser.add_argument("--intensity", type=int, nargs="+", default=[30, 40, 50, 60])
+    parser.add_argument("--percentage", type=float, nargs="+", default=[25, 35, 45])
+    parser.add_argument("--shift", type=int, default=0, help="Also try every patch offset up to +-shift pixels")
+    parser.add_argument("--shift-step", type=int, default=5)
+    parser.add_argument("--reference", default=os.path.join(image_dir, "reference.png"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--top", type=int, default=10, help="Number of best combinations to print")
+    args = parser.parse_args()
+
+    images = load_labelled_images(image_dir)
+    offsets = range(-args.shift, args.shift + 1, args.shift_step) if args.shift > 0 else [0]
+    grid = list(itertools.product(args.intensity, args.percentage, itertools.product(offsets, offsets)))
+    print(f"Evaluating {len(grid)} combinations on {len(images)} images with {args.workers} workers")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(images, args.reference)) as pool:
+        results = list(pool.map(evaluate, grid))
+    elapsed = time.perf_counter() - start
+
+    results.sort(key=lambda r: (r["accuracy"], r["exact"]), reverse=True)
+    print(f"\n{'intensity':>9} {'percent':>7} {'shift':>9} {'accuracy':>8} {'exact':>7} {'tp':>4} {'fp':>4} {'tn':>4} {'fn':>4}")
+    for r in results[:args.top]:
+        print(
+            f"{r['intensity_threshold']:>9} {r['percentage_threshold']:>7} {str(r['shift']):>9} "
+            f"{r['accuracy']:>8.3f} {r['exact']:>3}/{len(images):<3} {r['tp']:>4} {r['fp']:>4} {r['tn']:>4} {r['fn']:>4}"
+        )
+
+    checks = len(grid) * len(images)
+    check_seconds = sum(r["seconds"] for r in results)
+    print(f"\n{checks} image checks in {elapsed:.2f} s: {checks / elapsed:.0f} images/s overall, "
+          f"{checks / check_seconds:.0f} images/s per worker")
+
+
+if __name__ == "__main__":
+    main()
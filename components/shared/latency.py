@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+
+class LatencyRecorder:
+    """
+    Keeps the latest latency samples of each pipeline stage and summarizes them as percentiles.
+
+    Durations within a process are measured with time.monotonic(). Ages that
+    span processes (e.g. from the camera exposure to the speed slider) use the
+    host wall clock, since that is what the RealSense frame timestamps are in.
+    """
+
+    def __init__(self, window=1000):
+        """
+        Parameters:
+        window (int): Number of samples kept per stage.
+        """
+        self.window = window
+        self._samples = {}  # Stage -> deque of durations in seconds
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=self.window)
+            self._samples[stage].append(seconds)
+
+    def record_many(self, stage, samples):
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=self.window)
+            self._samples[stage].extend(samples)
+
+    @contextmanager
+    def measure(self, stage):
+        """Records how long the with block took."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, time.monotonic() - start)
+
+    def drain(self):
+        """
+        Returns and clears all samples, used to report them to another process.
+
+        Returns:
+        dict: Stage -> list of durations in seconds.
+        """
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items() if values}
+            self._samples.clear()
+        return samples
+
+    def stats(self):
+        """
+        Returns:
+        dict: Stage -> count and p50/p95/p99/max in milliseconds over the kept samples.
+        """
+        with self._lock:
+            samples = {stage: np.array(values) for stage, values in self._samples.items() if values}
+
+        stats = {}
+        for stage, values in samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+            stats[stage] = {
+                "count": len(values),
+                "p50": round(float(p50), 2),
+                "p95": round(float(p95), 2),
+                "p99": round(float(p99), 2),
+                "max": round(float(values.max()) * 1000, 2),
+            }
+        return stats
@@ -0,0 +1,86 @@
+import threading
+import numpy as np
+
+
+class PoseHistory:
+    """
+    Time-indexed ring buffer of robot pose samples.
+
+    Each sample is a flat vector (e.g. the TCP pose followed by the joint
+    positions). interpolate() returns the sample linearly interpolated to any
+    time covered by the buffer, so camera frames can be matched with the robot
+    pose at the time they were exposed instead of the newest one.
+    """
+
+    def __init__(self, size, capacity=256, nearest=None):
+        """
+        Parameters:
+        size (int): Number of values per sample.
+        capacity (int): Number of samples kept, at 50 Hz 256 samples cover about 5 s.
+        nearest (slice): Values taken from the closer sample instead of interpolated, e.g. a
+            rotation vector, which UR flips near |r| = pi so its components can not be blended.
+        """
+        self.capacity = capacity
+        self.nearest = nearest
+        self._timestamps = np.full(capacity, -np.inf)
+        self._values = np.zeros((capacity, size))
+        self._count = 0  # Number of samples ever appended
+        self._lock = threading.Lock()
+
+    def append(self, timestamp, values):
+        """Adds a sample, timestamps are expected to increase."""
+        with self._lock:
+            i = self._count % self.capacity
+            self._timestamps[i] = timestamp
+            self._values[i] = values
+            self._count += 1
+
+    def _ordered(self):
+        """Copies of the timestamps and values ordered from oldest to newest."""
+        with self._lock:
+            n = min(self._count, self.capacity)
+            start = self._count - n
+            idx = np.arange(start, self._count) % self.capacity
+            return self._timestamps[idx], self._values[idx]
+
+    def latest(self):
+        """
+        Returns:
+        tuple: (timestamp, values) of the newest sample, None if empty.
+        """
+        with self._lock:
+            if self._count == 0:
+                return None
+            i = (self._count - 1) % self.capacity
+            return self._timestamps[i], self._values[i].copy()
+
+    def interpolate(self, timestamp, max_extrapolation=0.05):
+        """
+        Returns the sample at timestamp, interpolated between the two samples around it.
+
+        Parameters:
+        timestamp (float): Time to interpolate to, in the same clock as the samples.
+        max_extrapolation (float): Times up to this many seconds after the newest
+            sample return the newest sample, the frame may be newer than the last pose that arrived.
+
+        Returns:
+        numpy.ndarray: The interpolated values, None if timestamp is not covered by the buffer.
+        """
+        timestamps, values = self._ordered()
+        if len(timestamps) == 0:
+            return None
+
+        if timestamp >= timestamps[-1]:
+            if timestamp - timestamps[-1] > max_extrapolation:
+                return None
+            return values[-1]
+        if timestamp < timestamps[0]:
+            return None
+
+        i = np.searchsorted(timestamps, timestamp, side="right")
+        t0, t1 = timestamps[i - 1], timestamps[i]
+        w = (timestamp - t0) / (t1 - t0) if t1 > t0 else 0.0
+        result = values[i - 1] + w * (values[i] - values[i - 1])
+        if self.nearest is not None:
+            result[self.nearest] = values[i if w >= 0.5 else i - 1][self.nearest]
+        return result
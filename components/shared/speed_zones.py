@@ -0,0 +1,6 @@
+# Human-robot distances (in meters) the robot speed is scaled between.
+# Shared by the state machine, which sets the speed, and the safety monitor,
+# which needs to know when the measured distance becomes safety critical.
+
+STOP_DISTANCE = 0.2  # The robot stops when a human is closer than this
+FULL_SPEED_DISTANCE = 0.5  # The robot runs at full speed when every human is further away than this
@@ -1,16 +1,28 @@
 import socketio
 from .events import Events  # Import the shared enum
 import time
-from typing import List
+from typing import List, NamedTuple
+import numpy as np
+from shared.pose_history import PoseHistory
+
+
+class RobotState(NamedTuple):
+    """A robot state sample pushed by the server"""
+    timestamp: float  # Server time the sample was read from the robot
+    received: float  # time.monotonic() when the sample arrived
+    tcp_pose: List[float]
+    q: List[float]  # Joint positions in radians
 
 
 # Initialize Socket.IO client
-def _create_client():
+def _create_client(on_connect=None):
     sio = socketio.Client()
 
     @sio.event
     def connect():
         print("Connected to server.")
+        if on_connect is not None:
+            on_connect()
 
     @sio.event
     def disconnect():
@@ -30,6 +42,11 @@ def _create_client():
 class RobotSocketClient:
     sioc = None
     socket_url = "http://localhost:5000"
+    robot_state = None  # Latest RobotState, only updated after subscribe_robot_state()
+    slider_time = None  # Server side duration of the last set_robot_velocity()
+    state_history = None  # PoseHistory of the pushed TCP poses and joint positions, in server time
+    _subscribed = False
+    _clock_offset = float("inf")  # Local time minus server time, estimated from the sample with the lowest latency
 
     def __init__(self, socket_url=None):
         print(socket_url)
@@ -41,7 +58,8 @@ class RobotSocketClient:
     def connect_to_server(self):
         while True:  # Keep trying to connect until it works
             try:
-                self.sioc = _create_client()
+                self.sioc = _create_client(on_connect=self._on_connect)
+                self.sioc.on(Events.ROBOT_STATE.value, self._on_robot_state)
                 self.sioc.connect(self.socket_url)
                 break
             except Exception as e:
@@ -49,6 +67,67 @@ class RobotSocketClient:
                 print("Trying again in 5 sec..")
                 time.sleep(5)
 
+    def _on_connect(self):
+        # Rooms do not survive a reconnect, subscribe again
+        if self._subscribed:
+            self.sioc.emit(Events.SUBSCRIBE_ROBOT_STATE.value)
+
+    def _on_robot_state(self, data):
+        # A single assignment, so readers always see a complete sample
+        self.robot_state = RobotState(data["timestamp"], time.monotonic(), data["tcp_pose"], data["q"])
+
+        # Latency only ever adds to the difference, so the smallest one is closest to the clock offset
+        self._clock_offset = min(self._clock_offset, time.time() - data["timestamp"])
+        # Kept in server time, the offset still shrinks and would make earlier local times unsorted
+        self.state_history.append(data["timestamp"], np.concatenate([data["tcp_pose"], data["q"]]))
+
+    def subscribe_robot_state(self):
+        """Lets the server push the TCP pose and joint positions, see get_robot_state()"""
+        if self.state_history is None:
+            self.state_history = PoseHistory(12, nearest=slice(3, 6))  # The TCP rotation vector is not interpolated
+        self._subscribed = True
+        self.sioc.emit(Events.SUBSCRIBE_ROBOT_STATE.value)
+
+    def unsubscribe_robot_state(self):
+        self._subscribed = False
+        self.sioc.emit(Events.UNSUBSCRIBE_ROBOT_STATE.value)
+        self.robot_state = None
+
+    def get_robot_state(self, max_age=None):
+        """
+        Latest pushed robot state, without a round trip to the server.
+
+        Parameters:
+        max_age (float): Samples older than this many seconds are not returned.
+
+        Returns:
+        RobotState: The latest sample, None if there is none or it is too old.
+        """
+        state = self.robot_state
+        if state is None:
+            return None
+        if max_age is not None and time.monotonic() - state.received > max_age:
+            return None
+        return state
+
+    def get_robot_state_at(self, timestamp):
+        """
+        Robot state interpolated to a point in time, e.g. when a camera frame was exposed.
+
+        Parameters:
+        timestamp (float): Local time.time() based timestamp.
+
+        Returns:
+        RobotState: The interpolated state, None if the history does not cover timestamp.
+        """
+        if self.state_history is None:
+            return None
+        server_timestamp = timestamp - self._clock_offset  # With the current, best offset estimate
+        values = self.state_history.interpolate(server_timestamp)
+        if values is None:
+            return None
+        return RobotState(server_timestamp, time.monotonic(), list(values[:6]), list(values[6:]))
+
     def _printe(self, s, e):
         print(f"Failed {s} with {e}")
 
@@ -78,12 +157,18 @@ class RobotSocketClient:
 
     def set_robot_velocity(self, speed_fraction=1):
         response = self.sioc.call(Events.SET_SPEED_VALUE.value, {"speed": speed_fraction})
+        self.slider_time = response.get("slider_time")  # Seconds the server took to set the slider
         return response["speed"]
 
     def get_actual_joint_positions(self):
         response = self.sioc.call(Events.JOINT_POSITIONS.value)
         return response["positions"]
 
+    def get_actual_q(self) -> List[float]:
+        """Joint positions in radians"""
+        response = self.sioc.call(Events.GET_JOINT_POSITIONS.value, timeout=5)
+        return response
+
     def moveJ_path(self, path):
         data = {"positions": path}
         response = self.sioc.call(Events.MOVE_TO_POSITION.value, data)
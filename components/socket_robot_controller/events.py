@@ -15,4 +15,7 @@ class Events(Enum):
     MOVE_TO_POSITION_L = "move_to_position_l"
     MOVE_TO_POSITION_J = "move_to_position_l"
     MOVE_L_SPEED_ACCEL = "move_l_SPEED_ACCEL"
-    ASYNC_PROGRESS = "async_progress"
\ No newline at end of file
+    ASYNC_PROGRESS = "async_progress"
+    SUBSCRIBE_ROBOT_STATE = "subscribe_robot_state"
+    UNSUBSCRIBE_ROBOT_STATE = "unsubscribe_robot_state"
+    ROBOT_STATE = "robot_state"
\ No newline at end of file
@@ -12,6 +12,8 @@ import time
 
 robot_enabled = True
 ROBOT_SPEED = 0.5
+ROBOT_STATE_RATE = 50  # Hz, TCP pose and joint positions pushed to subscribers
+ROBOT_STATE_ROOM = "robot_state"
 
 app = Flask(__name__)
 sio = socketio.Server(cors_allowed_origins="*")
@@ -87,9 +89,10 @@ def set_robot_velocity(self, data):
     print(f"Running: {Events.SET_SPEED_VALUE.value}")
     speed = data.get("speed", 0.5)
     ROBOT_SPEED = speed
+    start = time.monotonic()
     if robot_enabled:
         rtde_io.setSpeedSlider(ROBOT_SPEED)
-    return {"speed": ROBOT_SPEED}
+    return {"speed": ROBOT_SPEED, "slider_time": time.monotonic() - start}
 
 
 @sio.on(Events.JOINT_POSITIONS.value)
@@ -100,6 +103,46 @@ def get_actual_joint_positions(sid):
     return [1.0, 2.0, 3.0]
 
 
+@sio.on(Events.GET_JOINT_POSITIONS.value)
+def get_actual_q(sid) -> List[float]:
+    if robot_enabled:
+        return rtde_r.getActualQ()
+    return [0.0, -1.571, 1.571, -1.571, -1.571, 0.0]
+
+
+@sio.on(Events.SUBSCRIBE_ROBOT_STATE.value)
+def subscribe_robot_state(sid):
+    print(f"Client {sid} subscribed to the robot state")
+    sio.enter_room(sid, ROBOT_STATE_ROOM)
+    return {"rate": ROBOT_STATE_RATE}
+
+
+@sio.on(Events.UNSUBSCRIBE_ROBOT_STATE.value)
+def unsubscribe_robot_state(sid):
+    sio.leave_room(sid, ROBOT_STATE_ROOM)
+
+
+def stream_robot_state():
+    """Pushes the TCP pose and joint positions to all subscribers at ROBOT_STATE_RATE"""
+    period = 1 / ROBOT_STATE_RATE
+    next_time = time.time()
+    while True:
+        if robot_enabled:
+            tcp_pose = rtde_r.getActualTCPPose()
+            q = rtde_r.getActualQ()
+        else:
+            tcp_pose = [-0.08, -0.278, -0.151, 1.718, -2.631, -0.023]
+            q = [0.0, -1.571, 1.571, -1.571, -1.571, 0.0]
+        sio.emit(
+            Events.ROBOT_STATE.value,
+            {"timestamp": time.time(), "tcp_pose": list(tcp_pose), "q": list(q)},
+            room=ROBOT_STATE_ROOM,
+        )
+
+        next_time = max(next_time + period, time.time())  # Do not burst after a stall
+        sio.sleep(max(next_time - time.time(), 0))
+
+
 @sio.on(Events.MOVE_TO_POSITION_J.value)
 def moveJ_path(sid, data):
     print(f"Running: {Events.MOVE_TO_POSITION_J.value}")
@@ -150,6 +193,7 @@ def main():
 
     try:
         print("Starting Socket.IO server...")
+        sio.start_background_task(stream_robot_state)
         eventlet.wsgi.server(eventlet.listen(("0.0.0.0", 5000)), app)
         app.run(port=5000)
     except KeyboardInterrupt:
@@ -1,11 +1,15 @@
 import numpy as np
 from websocket import create_connection
 import requests
+import json
+import threading
 from typing import List
 
 from socket_robot_controller.client import RobotSocketClient
 from shared.interpolate import interpolate_tcp_poses
 from shared.ilogging import CustomLogger
+from shared.speed_zones import STOP_DISTANCE, FULL_SPEED_DISTANCE
+from shared.latency import LatencyRecorder
 import time
 import math
 
@@ -24,6 +28,11 @@ class StateMachine:
         self.hertz = 20
         self.sleep_adjust_count_max = 10*self.hertz
         self.sleep_adjust_count = 0
+        self.latency = LatencyRecorder()  # Reported to the safety monitor every latency_report_interval seconds
+        self.latency_report_interval = 5
+        self.last_latency_report = time.monotonic()
+        self.distance_age = None  # Age of the last distance from the safety monitor (s)
+        self.distance_received = None  # time.monotonic() when it arrived
 
         self.velocity = {"low": 0.1, "medium": 0.3, "high": 0.3}
         self.velocity = {"low": 0.4, "medium": 0.8, "high": 1.4}
@@ -31,13 +40,12 @@ class StateMachine:
         self.blend = {"non": 0.0, "low": 0.007, "large": 0.025}
         self.multiplier = 1.1
         self.tolerance = 0.004
-        while True:
-            try:
-                self.fixture_socket = create_connection("ws://127.0.0.1:8000/fixtures")
-                break
-            except Exception as e:
-                print(f"Failed to connect to fixture socket: {e}")
-                input("Waiting for key..")
+        # Fixture state pushed by the safety monitor, (seq, frame timestamp, fixture list), None while not connected
+        self.fixture_state = None
+        self.fixture_url = "ws://127.0.0.1:8000/ws/fixtures"
+        self.fixture_timeout = 3  # The monitor resends the state every second, silence for this long (s) means it is gone
+        self.fixture_thread = threading.Thread(target=self._receive_fixture_states, daemon=True)
+        self.fixture_thread.start()
     
         self.pose_intermediate = np.array([-0.14073875492311985, -0.1347932873639663, 0.50, 3.06, -0.6, -0.0175]) # Homej
         self.pose_place = np.array([-0.5765337725404966, 0.24690845869221661, 0.28, 3.06, -0.6, -0.0175]) 
@@ -72,26 +80,46 @@ class StateMachine:
         print("Done with init")
 
 
-    def request_fixture_status(self) -> List[bool]:
-        retries = 3
-        while retries != 0:
+    def _receive_fixture_states(self):
+        """Keeps self.fixture_state up to date with the fixture transitions pushed by the safety monitor"""
+        while not self.terminate:
             try:
-                self.fixture_socket.send_text("")
-                fixture_status = self.fixture_socket.recv()
-                fixture_status = list(map(lambda x: int(x), fixture_status.split(",")))
-                return fixture_status
-            except BrokenPipeError as e:
-                retries -= 1
-                print(f"Fixtures failed with {e}. Trying {retries} more times.")
+                fixture_socket = create_connection(self.fixture_url, timeout=self.fixture_timeout)
             except Exception as e:
-                self.fixture_socket = create_connection("http://localhost:8000/fixture")
-                raise Exception("Fixture socket failed with {e}")
+                print(f"Failed to connect to fixture socket: {e}. Trying again in 1 sec..")
+                self.fixture_state = None
+                time.sleep(1)
+                continue
+
+            last_seq = None  # The first message of a connection is the current state, also after a monitor restart
+            try:
+                while not self.terminate:
+                    update = json.loads(fixture_socket.recv())
+                    # The snapshot on connect and the push can deliver the same state twice
+                    if last_seq is None or update["seq"] > last_seq:
+                        last_seq = update["seq"]
+                        self.fixture_state = (update["seq"], update["timestamp"], update["fixtures"])
+            except Exception as e:
+                # Never decide on the state of a monitor that stopped sending
+                print(f"Fixture socket failed with {e}, reconnecting")
+                self.fixture_state = None
+                fixture_socket.close()
+
+    def request_fixture_status(self) -> List[bool]:
+        """Latest fixture state received from the safety monitor, without any I/O"""
+        fixture_state = self.fixture_state
+        if fixture_state is None:
+            raise Exception("No current fixture state from the safety monitor")
+        return fixture_state[2]
 
     def get_stress_level(self):
         try:
             result = None
-            response = requests.get("http://localhost:8000/data")
+            with self.latency.measure("stress_level_fetch"):
+                response = requests.get("http://localhost:8000/data")
             result = response.json()
+            self.distance_age = result.get("distance_age")
+            self.distance_received = time.monotonic()
             return (result["distance"], result["stress_status"])
         except Exception as e:
             res_text = response.text
@@ -116,11 +144,11 @@ class StateMachine:
 
     def _apply_base_speed_based_on_distance(self, distance_to_human):
         # Based on paper from the lego guy
-        if distance_to_human < 0.2:
+        if distance_to_human < STOP_DISTANCE:
             self.base_speed = 0
-        elif distance_to_human < 0.5:
+        elif distance_to_human < FULL_SPEED_DISTANCE:
             # Scale speed scale distance 0.2-0.5 to a 0-100 scale
-            self.base_speed = (distance_to_human - 0.2) / (0.5-0.2)
+            self.base_speed = (distance_to_human - STOP_DISTANCE) / (FULL_SPEED_DISTANCE - STOP_DISTANCE)
         else:
             self.base_speed = 1
 
@@ -132,22 +160,39 @@ class StateMachine:
         return round(self.speed_scaler*self.base_speed, 2)
 
 
+    def _set_robot_velocity(self, speed):
+        with self.latency.measure("set_velocity_rpc"):
+            self.robot_controller.set_robot_velocity(speed)
+        if self.robot_controller.slider_time is not None:
+            self.latency.record("server_slider_set", self.robot_controller.slider_time)
+        if self.distance_age is not None:
+            # Camera exposure until the speed slider is set
+            self.latency.record("photon_to_slider", self.distance_age + time.monotonic() - self.distance_received)
+            self.distance_age = None
+
+        if time.monotonic() - self.last_latency_report > self.latency_report_interval:
+            self._report_latency()
+
+    def _report_latency(self):
+        """Sends the latency samples to the safety monitor, which serves them on /metrics/latency"""
+        self.last_latency_report = time.monotonic()
+        try:
+            requests.post("http://localhost:8000/metrics/latency", json=self.latency.drain(), timeout=1)
+        except Exception as e:
+            print(f"Failed to report latency: {e}")
+
     def process_state_machine(self):
         """Process the state machine to control robot behavior."""
         # Handle state transitions
 
         print(f"Current state: {self.state}")
-        try:
-            self.fixture_socket.ping() # Keep connection alive
-        except BrokenPipeError:
-            print("Ping failed")
 
         speed = round(self.base_speed*self.speed_scaler, 2)
 
         (distance, stress_level) = self.get_stress_level()
         if stress_level is not None and distance is not None:        
             speed = self.calculate_robot_speed(distance, stress_level)
-        self.robot_controller.set_robot_velocity(speed) 
+        self._set_robot_velocity(speed)
         #print(f"Speed scaling is {speed:0.02f}")
         if self.robot_controller.is_running():
             return